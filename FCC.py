@@ -1,83 +1,387 @@
-import requests
+import fcntl
+import json
+import os
+import threading
+import time
 import urllib
-from dotenv import dotenv_values
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sessions import fcc_session
+from metrics import metrics
+import config
+
+class RenewalInProgress(Exception):
+    """No usable token while credentials are being renewed, for clients that must not wait"""
+
 
 class FCC:
 
     base_url = 'https://www.freeconferencecall.com/api/'
+    # Access tokens are refreshed this many seconds before they expire
+    refresh_margin = 300
+    # API credentials expire about 7 days after they are issued; renewal starts
+    # in the background this long before that
+    credential_lifetime = 7 * 24 * 3600
+    renew_before = 24 * 3600
+    # Wait this long before retrying a background renewal that failed
+    renewal_retry_interval = 3600
 
-    def call(self, req_type, url, data={}):
+    def _send(self, req_type, url, data):
+        headers = {'Authorization':'Bearer '+self.access_token}
         if req_type =='post':
-            return requests.post(self.base_url+url,data=data, headers={
-                'Authorization':'Bearer '+self.access_token
-            }).json()
+            return fcc_session.post(self.base_url+url,data=data, headers=headers)
         elif req_type=='get':
-            return requests.get(self.base_url+url+'?'+urllib.parse.urlencode(data), headers={
-                'Authorization':'Bearer '+self.access_token
-            }).json()
+            return fcc_session.get(self.base_url+url+'?'+urllib.parse.urlencode(data), headers=headers)
         elif req_type=='delete':
-            return requests.delete(self.base_url+url, headers={
-                'Authorization':'Bearer '+self.access_token
-            }).json()
+            return fcc_session.delete(self.base_url+url, headers=headers)
+
+    def call(self, req_type, url, data={}):
+        return self._request(req_type, url, data).json()
+
+    def _request(self, req_type, url, data={}):
+        self.check_credentials_age()
+        if time.time() > self.expires_at - self.refresh_margin:
+            self.authenticate()
+        token = self.access_token
+        with metrics.span('fcc_api', method=req_type):
+            r = self._send(req_type, url, data)
+        if r.status_code == 401:
+            # Token revoked or expired early: get a new one and retry once
+            print("Access token rejected, re-authenticating...")
+            metrics.count('retries_total', stage='fcc_api')
+            self.authenticate(stale_token=token)
+            with metrics.span('fcc_api', method=req_type):
+                r = self._send(req_type, url, data)
+        return r
 
-    def __init__(self, client_id, client_secret, username, password, auto_renew=True):
+    def __init__(self, client_id, client_secret, username, password, auto_renew=True, token_cache='.fcc_token.json',
+                 credentials_issued_at=None, env_file=None, wait_for_renewal=True):
+        # Kept as one tuple so a background renewal swaps id and secret together
+        self._client = (client_id, client_secret)
+        self.credentials_issued_at = float(credentials_issued_at) if credentials_issued_at else None
         self.username = username
         self.password = password
         self.auto_renew = auto_renew
-        
-        resp = requests.post(self.base_url+'v4/token',{
+        self.token_cache = token_cache
+        # Where renewed credentials are written; None means the main .env
+        self.env_file = env_file
+        # Without a valid token, block until a renewal finishes (True) or raise
+        # RenewalInProgress so the caller can get on with other work
+        self.wait_for_renewal = wait_for_renewal
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = 0
+        self._auth_lock = threading.Lock()
+        self._renewal_lock = threading.Lock()
+        self._renewal = None
+        self.renewal_error = None
+        self._renewal_failed_at = 0
+
+        if not self._load_token():
+            try:
+                self.authenticate()
+            except RenewalInProgress:
+                # Keep this client and its renewal; calls raise until the renewal is done
+                print("No usable token until the credential renewal finishes")
+        self.check_credentials_age()
+
+    @property
+    def client_id(self):
+        return self._client[0]
+
+    @property
+    def client_secret(self):
+        return self._client[1]
+
+    def check_credentials_age(self):
+        """Start a background renewal when the API credentials are close to expiring"""
+        if not self.auto_renew or self.credentials_issued_at is None:
+            return
+        if time.time() > self.credentials_issued_at + self.credential_lifetime - self.renew_before:
+            self.start_background_renewal()
+
+    def renewing(self):
+        """True while a background renewal is running"""
+        return self._renewal is not None and self._renewal.is_alive()
+
+    def _renewal_due(self, rejected_client=None):
+        """Whether the current credentials need renewing: the server rejected them
+        (rejected_client is the (id, secret) it refused) or they are close to expiry"""
+        if rejected_client is not None:
+            return rejected_client == self._client
+        if self.credentials_issued_at is None:
+            return True
+        return time.time() > self.credentials_issued_at + self.credential_lifetime - self.renew_before
+
+    def start_background_renewal(self, rejected_client=None):
+        """Renew the API credentials on a separate thread, returns the thread
+
+        Calls keep using the current access token meanwhile. When the renewal
+        succeeds the new client_id/client_secret are swapped into this instance
+        and used for every later token request. Only one renewal runs at a time,
+        and none starts while the credentials an earlier one produced are still
+        fresh (unless the server rejected them, see rejected_client), so a
+        long-running process renews again each time they near expiry. The
+        thread is not a daemon so the process waits for it before exiting.
+        """
+        with self._renewal_lock:
+            if self._renewal is not None and self._renewal.is_alive():
+                return self._renewal
+            if self.renewal_error is not None and time.time() < self._renewal_failed_at + self.renewal_retry_interval:
+                return self._renewal
+            if self._renewal is not None and self.renewal_error is None and not self._renewal_due(rejected_client):
+                # The last renewal already replaced these credentials
+                return self._renewal
+            self.renewal_error = None
+            self._renewal = threading.Thread(target=self._renew, name='fcc-credential-renewal')
+            self._renewal.start()
+            return self._renewal
+
+    @contextmanager
+    def _renewal_file_lock(self):
+        """Hold <env file>.renew.lock, so processes sharing the env file (a cron run
+        overlapping the daemon, say) never submit the renewal form at the same time"""
+        path = (self.env_file or config.env_file) + '.renew.lock'
+        with open(path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print("Another process is renewing these credentials, waiting for it...")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _renew(self):
+        try:
+            with self._renewal_file_lock():
+                settings = config.overlay_config(self.env_file) if self.env_file else config.reload_config()
+                renewed_at = float(settings.get('credentials_renewed_at') or 0)
+                if settings.get('client_id') != self.client_id and renewed_at > (self.credentials_issued_at or 0):
+                    # Another process renewed them while this one waited for the lock
+                    print("Credentials were renewed by another process")
+                else:
+                    from renew_credentials import FCCCredentialRenewer
+                    renewer = FCCCredentialRenewer(self.env_file)
+                    with metrics.span('credential_renewal'):
+                        if not renewer.renew_credentials():
+                            raise Exception("Credential renewal failed")
+                    # Reload config with new credentials
+                    settings = config.overlay_config(self.env_file) if self.env_file else config.reload_config()
+
+            self._client = (settings['client_id'], settings['client_secret'])
+            self.credentials_issued_at = float(settings.get('credentials_renewed_at') or time.time())
+            print("Credentials renewed successfully, switched to the new client_id")
+
+            # Get a token from the new credentials unless a caller is already authenticating
+            if self._auth_lock.acquire(blocking=False):
+                try:
+                    resp = self._password_grant()
+                    if 'access_token' in resp:
+                        self._save_token(resp)
+                    else:
+                        print("Authentication with renewed credentials failed:", resp)
+                finally:
+                    self._auth_lock.release()
+        except Exception as e:
+            print(f"Failed to renew credentials: {str(e)}")
+            self._renewal_failed_at = time.time()
+            self.renewal_error = e
+
+    def _load_token(self):
+        """Reuse a cached access token from an earlier run if it is still valid"""
+        if not self.token_cache:
+            return False
+        try:
+            with open(self.token_cache) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get('client_id') != self.client_id or cached.get('username') != self.username:
+            return False
+        self.access_token = cached['access_token']
+        self.refresh_token = cached.get('refresh_token')
+        self.expires_at = cached.get('expires_at', 0)
+        if time.time() > self.expires_at - self.refresh_margin:
+            # Close to expiry, refresh now rather than on the first call
+            self.authenticate()
+        else:
+            print(f"Using cached access token (expires in {int(self.expires_at - time.time())}s)")
+        return True
+
+    def _save_token(self, resp):
+        self.access_token = resp['access_token']
+        self.refresh_token = resp.get('refresh_token', self.refresh_token)
+        self.expires_at = time.time() + int(resp.get('expires_in') or 3600)
+        if not self.token_cache:
+            return
+        tmp = self.token_cache + '.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'client_id': self.client_id,
+                'username': self.username,
+                'access_token': self.access_token,
+                'refresh_token': self.refresh_token,
+                'expires_at': self.expires_at
+            }, f)
+        os.replace(tmp, self.token_cache)
+
+    def _token_request(self, grant):
+        client_id, client_secret = self._client
+        with metrics.span('fcc_token', grant=grant['grant_type']):
+            return fcc_session.post(self.base_url+'v4/token', dict(grant, **{
+                'client_id':client_id,
+                'client_secret':client_secret
+            })).json()
+
+    def _password_grant(self):
+        return self._token_request({
             'grant_type':'password',
-            'client_id':client_id,
-            'client_secret':client_secret,
-            'username':username,
-            'password':password
-        }).json()
+            'username':self.username,
+            'password':self.password
+        })
+
+    def authenticate(self, stale_token=None):
+        """Get a fresh access token: refresh grant when possible, else password grant.
+
+        Thread-safe; if another thread already replaced stale_token, its token is
+        reused instead of authenticating again.
+        """
+        with self._auth_lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return
+            if stale_token is None and self.access_token and time.time() < self.expires_at - self.refresh_margin:
+                return
+            if self.refresh_token:
+                resp = self._token_request({
+                    'grant_type':'refresh_token',
+                    'refresh_token':self.refresh_token
+                })
+                if 'access_token' in resp:
+                    print("Access token refreshed")
+                    self._save_token(resp)
+                    return
+                self.refresh_token = None
+            self._authenticate_password()
+
+    def _authenticate_password(self):
+        client = self._client
+        resp = self._password_grant()
         print(resp)
         
         # Check for invalid credentials
         if 'error' in resp and resp['error'] == 'invalid_client' and self.auto_renew:
             print("Invalid credentials detected. Attempting to renew...")
+            renewal = self.start_background_renewal(rejected_client=client)
             
-            try:
-                from renew_credentials import FCCCredentialRenewer
-                renewer = FCCCredentialRenewer()
-                renewal_success = renewer.renew_credentials()
-                
-                if renewal_success:
-                    print("Credentials renewed successfully. Retrying authentication...")
-                    
-                    # Reload config with new credentials
-                    config = dotenv_values(".env")
-                    client_id = config['client_id']
-                    client_secret = config['client_secret']
-                    
-                    # Retry authentication with new credentials
-                    resp = requests.post(self.base_url+'v4/token',{
-                        'grant_type':'password',
-                        'client_id':client_id,
-                        'client_secret':client_secret,
-                        'username':username,
-                        'password':password
-                    }).json()
-                    print("Authentication retry response:", resp)
-                else:
-                    raise Exception("Credential renewal failed")
-            except Exception as e:
-                raise Exception(f"Failed to renew credentials: {str(e)}")
+            if self.access_token and time.time() < self.expires_at:
+                print("Current access token is still valid, renewing in the background")
+                return
+            
+            if not self.wait_for_renewal:
+                raise RenewalInProgress("Credentials are being renewed")
+            # No usable token: nothing can run until the renewal finishes
+            renewal.join()
+            if self.renewal_error is not None:
+                raise Exception(f"Failed to renew credentials: {str(self.renewal_error)}")
+            print("Retrying authentication...")
+            
+            # Retry authentication with new credentials
+            resp = self._password_grant()
+            print("Authentication retry response:", resp)
         
         if 'access_token' not in resp:
             raise Exception(f"Authentication failed: {resp}")
         
-        self.access_token = resp['access_token']
+        self._save_token(resp)
 
-    def getConferences(self):
-        resp = self.call('get', 'v4/conferences', {
+    def _conferences_page(self, page_size, since, before):
+        params = {
             'has_recordings':'true',
+            'deleted':'false',
             'order_by':'start_date',
-            'order':'DESC'
-        })
-        return resp['conferences']
+            'order':'DESC',
+            'per_page':page_size
+        }
+        if since is not None:
+            params['start_date_from'] = since
+        if before is not None:
+            params['start_date_to'] = before
+        return self.call('get', 'v4/conferences', params).get('conferences') or []
+
+    def iter_conferences(self, page_size=50, since=None):
+        """Lazily yield conferences that still have a recording, newest first.
+
+        Pages are requested on demand and the next page is prefetched in the
+        background while the caller works on the current one. Paging is keyed on
+        the oldest start_date seen rather than a page number, so deleting
+        conferences mid-iteration does not shift later pages. Filters are sent to
+        the API and re-checked locally, so deleted or recording-less conferences
+        and ones starting before `since` (unix timestamp) are never yielded.
+        """
+        seen = set()
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            pending = prefetch.submit(self._conferences_page, page_size, since, None)
+            while pending is not None:
+                page = pending.result()
+                conferences = [c for c in page if c['id'] not in seen]
+                pending = None
+                # The API may cap per_page below page_size, so a short page is not
+                # necessarily the last; stop on an empty page, or one of only repeats
+                # (the API ignored the cursor)
+                if conferences:
+                    before = min(c.get('start_time', 0) for c in conferences)
+                    pending = prefetch.submit(self._conferences_page, page_size, since, before)
+
+                for c in conferences:
+                    seen.add(c['id'])
+                    if since is not None and c.get('start_time', 0) < since:
+                        # Results are ordered newest first, nothing older is wanted
+                        if pending is not None:
+                            pending.cancel()
+                        return
+                    if not c.get('deleted') and c.get('recording_url'):
+                        yield c
+
+    def getConferences(self):
+        return list(self.iter_conferences())
     
     def deleteConference(self, id):
-        resp = self.call('delete', 'v4/conferences/{0}'.format(id))
-        return resp
+        r = self._request('delete', 'v4/conferences/{0}'.format(id))
+        if r.status_code == 404:
+            # Already gone, e.g. deleted by an earlier attempt whose response was lost
+            return {}
+        r.raise_for_status()
+        return r.json() if r.content else {}
+
+    def deleteConferences(self, ids, workers=4, attempts=3, backoff=1.0):
+        """Delete many conferences, returns (deleted ids, {id: last error})
+
+        The API has no bulk delete, so the ids are deleted concurrently over up
+        to `workers` connections. Ids that fail are retried together after a
+        pause that doubles each round, for at most `attempts` rounds.
+        """
+        pending = list(ids)
+        deleted = []
+        failed = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for attempt in range(attempts):
+                if attempt:
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                    metrics.count('retries_total', len(pending), stage='fcc_delete')
+                futures = [(id, pool.submit(self.deleteConference, id)) for id in pending]
+                pending = []
+                for id, future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed[id] = e
+                        pending.append(id)
+                    else:
+                        failed.pop(id, None)
+                        deleted.append(id)
+                if not pending:
+                    break
+        return deleted, failed
@@ -0,0 +1,48 @@
+import os
+from config import get_config, overlay_config
+from FCC import FCC
+
+class Account:
+    """One FCC account processed by this runner.
+
+    With env_file set, the account's settings are that file layered over the
+    main .env, and renewed credentials are written back to it; each account
+    keeps its own token cache and listing cursor. The account without env_file
+    is the classic single-account setup driven by .env alone.
+    """
+
+    def __init__(self, name, env_file=None, wait_for_renewal=True):
+        self.name = name
+        self.env_file = env_file
+        # With other accounts to serve, a renewal raises RenewalInProgress instead of blocking
+        self.wait_for_renewal = wait_for_renewal
+        self.fcc = None
+        settings = self.settings()
+        # Most recordings of this account in flight at once, None for no cap
+        self.max_in_flight = int(settings.get('ACCOUNT_MAX_IN_FLIGHT') or 0) or None
+
+    def settings(self):
+        return overlay_config(self.env_file) if self.env_file else get_config()
+
+    def cursor(self, kind):
+        """Name of this account's listing cursor of the given kind in the state index"""
+        return f'{kind}:{self.name}' if self.env_file else kind
+
+    def connect(self):
+        """Return the account's FCC client, authenticating on first use"""
+        if self.fcc is None:
+            s = self.settings()
+            self.fcc = FCC(s['client_id'], s['client_secret'], s['username'], s['password'],
+                           token_cache=f'.fcc_token.{self.name}.json' if self.env_file else '.fcc_token.json',
+                           credentials_issued_at=s.get('credentials_renewed_at'), env_file=self.env_file,
+                           wait_for_renewal=self.wait_for_renewal)
+        return self.fcc
+
+
+def load_accounts(spec=None):
+    """Accounts from ACCOUNTS, a comma-separated list of env files (each account
+    is named after its file), or the single .env account when it is empty"""
+    if not spec:
+        return [Account('default')]
+    paths = [p.strip() for p in spec.split(',') if p.strip()]
+    return [Account(os.path.splitext(os.path.basename(p))[0], p, wait_for_renewal=len(paths) == 1) for p in paths]
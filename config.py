@@ -0,0 +1,45 @@
+"""
+Settings from the .env file, read once and shared by every module
+"""
+
+import threading
+from dotenv import dotenv_values
+
+env_file = '.env'
+_config = {}
+_loaded = False
+# Held while the dict is rewritten or copied; single-key reads need no lock
+_lock = threading.Lock()
+
+def get_config():
+    """Return the settings dict, reading env_file on first use"""
+    global _loaded
+    if not _loaded:
+        reload_config()
+    return _config
+
+def reload_config():
+    """Re-read env_file, e.g. after a credential renewal rewrote it
+
+    The dict is updated in place, so modules holding a reference from
+    get_config() see the new values. New values are set before stale keys
+    are removed, so a concurrent reader never finds a key missing that is
+    present both before and after.
+    """
+    global _loaded
+    values = dotenv_values(env_file)
+    with _lock:
+        _config.update(values)
+        for key in [k for k in _config if k not in values]:
+            del _config[key]
+        _loaded = True
+    return _config
+
+def overlay_config(path):
+    """Settings from another env file (e.g. one FCC account) layered over the
+    main ones; path is read on every call"""
+    settings = get_config()
+    with _lock:
+        merged = dict(settings)
+    merged.update(dotenv_values(path))
+    return merged
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+def file_digest(path, start=0, end=None, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of path[start:end], read in chunks"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return h.hexdigest()
+
+
+class FileIdCache:
+    """Content-addressed map of SHA-256 digest -> Telegram file_id.
+
+    A file Telegram has already stored can be sent again by its file_id in one
+    small request instead of uploading the bytes. Entries older than ttl seconds
+    are ignored, and past max_entries the least recently used one is dropped.
+    The cache is saved to path (JSON, least recently used first) after every
+    change so it survives restarts; path=None keeps it in memory only.
+    """
+
+    def __init__(self, path=None, max_entries=10000, ttl=30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for digest, (file_id, stored_at) in entries.items():
+            if now - stored_at < self.ttl:
+                self._entries[digest] = (file_id, stored_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+    def get(self, digest):
+        """Return the cached file_id for digest, or None"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if time.time() - entry[1] >= self.ttl:
+                del self._entries[digest]
+                self._save()
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def put(self, digest, file_id):
+        with self._lock:
+            self._entries[digest] = (file_id, time.time())
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def discard(self, digest):
+        """Forget digest, e.g. after Telegram rejected its file_id"""
+        with self._lock:
+            if self._entries.pop(digest, None) is not None:
+                self._save()
+
+    def __len__(self):
+        return len(self._entries)
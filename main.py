@@ -1,50 +1,399 @@
-import requests
+import os
+import sys
+import random
+import signal
+import threading
+import time
 import traceback
 import html
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from dotenv import dotenv_values
-from FCC import FCC
-from telegram_utils import send_telegram_message, send_telegram_file
+from telegram_utils import (send_telegram_message, send_telegram_file, send_telegram_file_path, send_telegram_file_id,
+                            upload_mode, chat_id)
+from recording import download_segmented, default_chunk_size
+from mp3_split import split_points, iter_range
+from transcode import Transcoder
+from file_cache import file_digest
+from pipeline import TransferPipeline
+from FCC import RenewalInProgress
+from state import StateIndex
+from accounts import load_accounts
+from scheduler import FairScheduler
+from routing import Router
+from webhook import RecordingWebhook
+from metrics import metrics
+from config import get_config
 
-config = dotenv_values(".env")
+config = get_config()
 
-client_id = config['client_id']
-client_secret = config['client_secret']
-username = config['username']
-password = config['password']
+# One process can serve several FCC accounts: ACCOUNTS lists one env file per account
+# (credentials and optional ACCOUNT_MAX_IN_FLIGHT, over this .env); empty means just .env
+accounts = load_accounts(config.get('ACCOUNTS'))
+chunk_size = int(config.get('DOWNLOAD_CHUNK_SIZE') or default_chunk_size)
+download_workers = int(config.get('DOWNLOAD_WORKERS') or 2)
+upload_workers = int(config.get('UPLOAD_WORKERS') or 2)
+# Conferences are deleted in one burst after all uploads, this many at a time
+delete_workers = int(config.get('DELETE_WORKERS') or 4)
+# Optional JSON routing rules sending each recording to one or more chats (see routing.py);
+# without it everything goes to TELEGRAM_CHAT_ID
+router = Router.load(config.get('TELEGRAM_ROUTES'), chat_id)
+# Tries per chat before a recording's delivery counts as failed for this run
+delivery_attempts = int(config.get('DELIVERY_ATTEMPTS') or 3)
+# Parallel byte ranges per recording; 1 keeps the resumable single-stream download
+download_segments = int(config.get('DOWNLOAD_SEGMENTS') or 1)
+page_size = int(config.get('FCC_PAGE_SIZE') or 50)
+# Bot API uploads are capped at 50 MB (2000 MB on a local server); leave room for the multipart envelope
+max_upload = int(config.get('TELEGRAM_MAX_UPLOAD') or (2000 if upload_mode == 'local' else 49) * 1024 * 1024)
+# Optional: TRANSCODE=opus re-encodes recordings to Opus at TRANSCODE_BITRATE bit/s with
+# ffmpeg, TRANSCODE_WORKERS at a time, and sends them as TRANSCODE_SEND_AS (voice or audio)
+transcoder = None
+if (config.get('TRANSCODE') or '').lower() == 'opus':
+    transcoder = Transcoder(int(config.get('TRANSCODE_BITRATE') or 24000),
+                            int(config.get('TRANSCODE_WORKERS') or 0) or None, max_upload)
+send_as = (config.get('TRANSCODE_SEND_AS') or 'voice').lower() if transcoder else 'audio'
+state_db = config.get('STATE_DB') or 'state.db'
+# Partial downloads are kept here between runs so they can be resumed
+spool_dir = config.get('SPOOL_DIR') or 'spool'
+# Optional metrics exports: Prometheus textfile and/or JSON run report
+metrics_textfile = config.get('METRICS_TEXTFILE')
+metrics_json = config.get('METRICS_JSON')
+# Daemon mode (main.py --daemon): seconds between polls, randomised by +/- jitter
+poll_interval = float(config.get('POLL_INTERVAL') or 300)
+poll_jitter = float(config.get('POLL_JITTER') or 30)
+# Runs only list conferences that started after the last one seen (minus this many
+# seconds, for recordings that become ready late); a full listing still runs this often
+cursor_overlap = float(config.get('CURSOR_OVERLAP') or 86400)
+full_scan_interval = float(config.get('FULL_SCAN_INTERVAL') or 86400)
+# Optional "recording ready" receiver: a POST here wakes the daemon for an immediate poll
+webhook_port = config.get('WEBHOOK_PORT')
+webhook_host = config.get('WEBHOOK_HOST') or '127.0.0.1'
+webhook_token = config.get('WEBHOOK_TOKEN')
 
-send_telegram_message('🚀 <b>Download Job Started</b>')
+def recording_filename(c, part=None, parts=1, ext='.mp3'):
+    name = datetime.fromtimestamp(c['start_time']).strftime('%Y-%m-%d')
+    if parts > 1:
+        name += f' (part {part} of {parts})'
+    return name+ext
 
-try:
-    fcc = FCC(client_id, client_secret, username, password)
-    conf = fcc.getConferences()
-    for c in conf:
+def make_pipeline(spool_dir, index, on_uploaded):
+    """Build the download/upload pipeline; on_uploaded(c) is called for every
+    conference that reached all its chats, to be deleted once the pipeline is done"""
+    def prepare(c, path):
+        """Turn a spooled recording into (path, [(file, start, end), ...]) upload parts
+
+        Runs in the pipeline's process stage, TRANSCODE_WORKERS at a time, between
+        downloads and uploads so encodes hold neither download nor upload slots.
+        """
+        if path is None:
+            return None
+        if transcoder:
+            files = transcoder.transcode(path, os.path.join(spool_dir, str(c['id'])))
+            print(f'transcoded {c["id"]}: {os.path.getsize(path)} -> {sum(map(os.path.getsize, files))} bytes')
+            return path, [(f, 0, os.path.getsize(f)) for f in files]
+        # Recordings over the upload limit go out as a numbered series of parts
+        return path, [(path, start, end) for start, end in split_points(path, max_upload)]
+
+    def download(c):
         print(c['id'])
-        if not c['deleted'] and 'recording_url' in c and c['recording_url'] != '':
-            try:
-                r = requests.get(c['recording_url']+'.mp3', allow_redirects=True, verify=False)
-                print('file downloaded')
-                filename = datetime.fromtimestamp(c['start_time']).strftime('%Y-%m-%d')+'.mp3'
-                send_telegram_file(r.content, filename)
-                print('sent to telegram')
-            except Exception as e:
-                print(e)
-                tb = html.escape(traceback.format_exc())
-                send_telegram_message(f'❌ <b>Download Failed for {c["id"]}:</b>\n<pre>{tb}</pre>')
+        done = index.get(c['id'], c['recording_url'])
+        if done and done['uploaded_at']:
+            print(f'{c["id"]} already uploaded, skipping to delete')
+            return None, 0
+        path = os.path.join(spool_dir, f"{c['id']}.mp3")
+        if done and done['downloaded_at'] and os.path.exists(path):
+            print(f'{c["id"]} already downloaded')
+            return path, 0
+        size = download_segmented(c['recording_url'], path, download_segments, chunk_size)
+        index.mark_downloaded(c['id'], c['recording_url'], size)
+        print(f'downloaded {c["id"]}')
+        return path, size
+
+    def send_parts(c, parts, chat, file_ids, sent):
+        """Send every part not yet in `sent` to chat, by file_id when another chat already has it"""
+        for n, (path, start, end) in enumerate(parts, 1):
+            if n <= len(sent):
                 continue
-            
+            filename = recording_filename(c, n, len(parts), os.path.splitext(path)[1])
+            file_id = None
+            if file_ids and file_ids[n - 1]:
+                # None means Telegram no longer has the file; any other failure is retried as is
+                file_id = send_telegram_file_id(file_ids[n - 1], filename, chat, send_as)
+            if file_id is None:
+                # Parts Telegram already has (e.g. from a run that failed halfway) are re-sent by file_id
+                digest = file_digest(path, start, end, chunk_size)
+                if upload_mode == 'local' and (start, end) == (0, os.path.getsize(path)):
+                    file_id = send_telegram_file_path(path, filename, digest, chat, send_as)
+                else:
+                    file_id = send_telegram_file(iter_range(path, start, end, chunk_size), filename,
+                                                 end - start, digest, chat, send_as)
+            if not file_id:
+                raise Exception(f'Telegram upload failed for {filename}')
+            sent.append(file_id if isinstance(file_id, str) else '')
+
+    def upload(c, spooled):
+        if spooled is None:
+            on_uploaded(c)
+            return 0
+        path, parts = spooled
+        size = sum(end - start for _, start, end in parts)
+        done = index.deliveries(c['id'], c['recording_url'])
+        # The recording is uploaded once; every other chat gets it by file_id
+        file_ids = None
+        for d in done.values():
+            if d['delivered_at'] and d['file_ids'] and len(d['file_ids'].split(',')) == len(parts):
+                file_ids = d['file_ids'].split(',')
+                break
+
+        failed = []
+        for chat in router.destinations(c):
+            if chat in done and done[chat]['delivered_at']:
+                continue
+            sent = []
+            for attempt in range(delivery_attempts):
+                try:
+                    send_parts(c, parts, chat, file_ids, sent)
+                except Exception as e:
+                    index.mark_delivery_failed(c['id'], c['recording_url'], chat, str(e))
+                    if attempt + 1 == delivery_attempts:
+                        failed.append(f'{chat}: {e}')
+                    else:
+                        time.sleep(2 ** attempt)
+                    continue
+                index.mark_delivered(c['id'], c['recording_url'], chat, ','.join(sent))
+                if file_ids is None and all(sent):
+                    file_ids = sent
+                break
+        if failed:
+            # Keep the spooled file so the next run retries the missing chats without downloading
+            raise Exception('Telegram delivery failed for ' + '; '.join(failed))
+
+        index.mark_uploaded(c['id'], c['recording_url'], ','.join(file_ids or []) or None)
+        for part in {p for p, _, _ in parts} | {path}:
+            os.remove(part)
+        print(f'sent {c["id"]} to telegram')
+        on_uploaded(c)
+        return size
+
+    def on_error(stage, c, e):
+        print(e)
+        tb = html.escape(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+        if stage == 'delete':
             # Delete conference only if download and send were successful
-            try:
-                fcc.deleteConference(c['id'])
-                print(f'deleted conference {c["id"]}')
-            except Exception as e:
-                print(f'Failed to delete conference: {e}')
-                tb = html.escape(traceback.format_exc())
-                send_telegram_message(f'⚠️ <b>Failed to delete conference {c["id"]}:</b>\n<pre>{tb}</pre>')
-
-    send_telegram_message('✅ <b>Download Job Completed</b>')
-except Exception as e:
-    tb = html.escape(traceback.format_exc())
-    error_msg = f'❌ <b>Critical Job Failure:</b>\n<pre>{tb}</pre>'
-    print(error_msg)
-    send_telegram_message(error_msg)
+            send_telegram_message(f'⚠️ <b>Failed to delete conference {c["id"]}:</b>\n<pre>{tb}</pre>')
+        else:
+            send_telegram_message(f'❌ <b>Download Failed for {c["id"]}:</b>\n<pre>{tb}</pre>')
+
+    return TransferPipeline(download, upload, on_error=on_error,
+                            download_workers=download_workers, upload_workers=upload_workers,
+                            process=prepare, process_workers=transcoder.workers if transcoder else download_workers)
+
+def delete_uploaded(fcc, index, conferences, pipeline):
+    """Delete the conferences whose recordings were uploaded, concurrently and
+    with retries; results are counted in the pipeline's delete stage"""
+    if not conferences:
+        return
+    by_id = {c['id']: c for c in conferences}
+    start = time.time()
+    deleted, failed = fcc.deleteConferences(list(by_id), workers=delete_workers)
+    per_item = (time.time() - start) / len(by_id)
+    stats = pipeline.stats['delete']
+    for id in deleted:
+        index.mark_deleted(id, by_id[id]['recording_url'])
+        stats.record(0, per_item)
+        print(f'deleted conference {id}')
+    for id, e in failed.items():
+        stats.fail(per_item)
+        pipeline.on_error('delete', by_id[id], e)
+
+def export_metrics():
+    try:
+        if metrics_textfile:
+            metrics.write_prometheus(metrics_textfile)
+        if metrics_json:
+            metrics.write_json(metrics_json)
+    except Exception as e:
+        print(f'Failed to write metrics: {e}')
+
+def run_job(accounts, index, on_start=None):
+    """Download, upload and delete every new conference that has a recording, once
+
+    All accounts share one pipeline, connection pool and Telegram rate limit;
+    a FairScheduler takes their conferences in turns, with at most
+    ACCOUNT_MAX_IN_FLIGHT of an account's recordings in flight. Only conferences
+    from CURSOR_OVERLAP before the newest one an account handled last time are
+    listed, so a cycle with nothing new costs a single API page per account;
+    every FULL_SCAN_INTERVAL the whole listing is walked instead. Accounts
+    connect concurrently. An account that cannot connect or list is reported
+    and skipped, and the job only fails when every account did; one that is
+    waiting for its credential renewal is skipped quietly until a later run.
+    on_start(pipeline) is called before work begins, so a caller can keep a
+    handle to stop() it.
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    started = time.time()
+    errors = {}
+    renewing = set()
+    listings = {}
+    with ThreadPoolExecutor(max_workers=len(accounts)) as pool:
+        connects = [(account, pool.submit(account.connect)) for account in accounts]
+    for account, connect in connects:
+        try:
+            fcc = connect.result()
+        except RenewalInProgress:
+            renewing.add(account.name)
+            continue
+        except Exception as e:
+            errors[account.name] = e
+            continue
+        if fcc.access_token is None and fcc.renewing():
+            renewing.add(account.name)
+            continue
+        cursor = index.get_cursor(account.cursor('conferences'))
+        full_scan = (cursor is None or
+                     started - (index.get_cursor(account.cursor('full_scan')) or 0) > full_scan_interval)
+        since = None if full_scan else cursor - cursor_overlap
+        if since is not None:
+            print(f'{account.name}: listing conferences since {datetime.fromtimestamp(since)}')
+        listings[account.name] = (account, since)
+
+    seen = {name: [] for name in listings}
+    failed = {name: [] for name in listings}
+    uploaded = {name: [] for name in listings}
+
+    def on_uploaded(c):
+        uploaded[c['_account']].append(c)
+        scheduler.release(c['_account'])
+
+    pipeline = make_pipeline(spool_dir, index, on_uploaded)
+    report_error = pipeline.on_error
+
+    def on_error(stage, c, e):
+        failed[c['_account']].append(c.get('start_time', 0))
+        if stage != 'delete':
+            scheduler.release(c['_account'])
+        report_error(stage, c, e)
+    pipeline.on_error = on_error
+
+    def listed(account, since):
+        for c in account.fcc.iter_conferences(page_size, since):
+            seen[account.name].append(c.get('start_time', 0))
+            yield dict(c, _account=account.name)
+
+    scheduler = FairScheduler([(name, listed(account, since), account.max_in_flight)
+                               for name, (account, since) in listings.items()], stopped=pipeline.stopped)
+    if on_start:
+        on_start(pipeline)
+    try:
+        pipeline.run(c for _, c in scheduler)
+    finally:
+        # Even after an error, clean up what was uploaded
+        for name, (account, _) in listings.items():
+            delete_uploaded(account.fcc, index, uploaded[name], pipeline)
+    print(pipeline.report())
+    for name, e in scheduler.errors.items():
+        if isinstance(e, RenewalInProgress):
+            renewing.add(name)
+        else:
+            errors[name] = e
+    for name in sorted(renewing):
+        print(f'Account {name} skipped: credentials are being renewed')
+
+    # Only move a cursor after a complete listing; a failed conference holds it
+    # back so the next run lists it again
+    if not pipeline.stopped():
+        for name, (account, since) in listings.items():
+            if name in errors or name in renewing:
+                continue
+            if failed[name]:
+                index.set_cursor(account.cursor('conferences'), min(failed[name]))
+            elif seen[name] or since is None:
+                index.set_cursor(account.cursor('conferences'), max(seen[name], default=started))
+            if since is None:
+                index.set_cursor(account.cursor('full_scan'), started)
+
+    if errors and len(errors) == len(accounts):
+        raise next(iter(errors.values()))
+    for name, e in errors.items():
+        print(f'Account {name} failed: {e}')
+        tb = html.escape(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+        send_telegram_message(f'❌ <b>Account {html.escape(name)} failed:</b>\n<pre>{tb}</pre>')
+    return pipeline
+
+def main():
+    send_telegram_message('🚀 <b>Download Job Started</b>')
+
+    try:
+        index = StateIndex(state_db)
+        pipeline = run_job(accounts, index)
+        index.close()
+
+        send_telegram_message(f'✅ <b>Download Job Completed</b>\n<pre>{html.escape(pipeline.report())}</pre>', wait=True)
+    except Exception as e:
+        tb = html.escape(traceback.format_exc())
+        error_msg = f'❌ <b>Critical Job Failure:</b>\n<pre>{tb}</pre>'
+        print(error_msg)
+        send_telegram_message(error_msg, wait=True)
+    finally:
+        export_metrics()
+
+def run_daemon():
+    """Poll FCC forever in one process
+
+    The FCC clients (and their tokens), the HTTP sessions and the state index are
+    created once and reused by every cycle. SIGTERM/SIGINT stop new downloads,
+    let in-flight transfers and uploads drain, then exit. With WEBHOOK_PORT set,
+    a notification POSTed there starts the next cycle right away.
+    """
+    stop = threading.Event()
+    wake = threading.Event()
+    current = []
+
+    def shutdown(signum, frame):
+        print('Shutdown requested, draining in-flight uploads...')
+        stop.set()
+        wake.set()
+        for pipeline in current:
+            pipeline.stop()
+
+    def track(pipeline):
+        current.append(pipeline)
+        if stop.is_set():
+            pipeline.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    send_telegram_message(f'🚀 <b>Download Daemon Started</b> (every {poll_interval:.0f}s)')
+
+    receiver = None
+    if webhook_port:
+        receiver = RecordingWebhook(webhook_port, webhook_host, webhook_token, wake).start()
+        print(f'Listening for recording notifications on {webhook_host}:{receiver.port}')
+
+    index = StateIndex(state_db)
+    while not stop.is_set():
+        # Notifications that arrive during this cycle trigger another one
+        wake.clear()
+        try:
+            pipeline = run_job(accounts, index, on_start=track)
+            if pipeline.processed():
+                send_telegram_message(f'✅ <b>Download Cycle Completed</b>\n<pre>{html.escape(pipeline.report())}</pre>')
+        except Exception as e:
+            tb = html.escape(traceback.format_exc())
+            error_msg = f'❌ <b>Download Cycle Failed:</b>\n<pre>{tb}</pre>'
+            print(error_msg)
+            send_telegram_message(error_msg)
+        finally:
+            current.clear()
+            export_metrics()
+        wake.wait(max(1.0, poll_interval + random.uniform(-poll_jitter, poll_jitter)))
+
+    if receiver:
+        receiver.close()
+    index.close()
+    send_telegram_message('🛑 <b>Download Daemon Stopped</b>', wait=True)
+
+if __name__ == "__main__":
+    if '--daemon' in sys.argv:
+        run_daemon()
+    else:
+        main()
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Latency histogram buckets in seconds, from API calls up to multi-hour transfers
+default_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    """Cumulative bucket counts plus the last `max_samples` values for quantiles,
+    so a long-running daemon reports recent latency rather than its first hours"""
+
+    def __init__(self, buckets=default_buckets, max_samples=10000):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.samples.append(value)
+
+    def quantile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """Process-wide run metrics: latency histograms, counters and gauges.
+
+    Timing spans wrap each stage (FCC API calls, recording downloads, Telegram
+    uploads, credential renewal). Results export as a Prometheus textfile (for
+    node_exporter's textfile collector) or a JSON run report.
+    """
+
+    def __init__(self, prefix='fcc'):
+        self.prefix = prefix
+        self.started_at = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            key = _key(name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        with self._lock:
+            key = _key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time a block into the <prefix>_stage_seconds histogram; failures are
+        also counted in <prefix>_stage_errors_total"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.count('stage_errors_total', stage=stage, **labels)
+            raise
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def prometheus(self):
+        lines = []
+        typed = set()
+
+        def declare(full, kind):
+            if full not in typed:
+                typed.add(full)
+                lines.append(f'# TYPE {full} {kind}')
+
+        with self._lock:
+            for (name, labels), h in sorted(self.histograms.items()):
+                full = f'{self.prefix}_{name}'
+                declare(full, 'histogram')
+                for bound, n in zip(h.buckets, h.counts):
+                    lines.append(f'{full}_bucket{_label_text(labels, [("le", bound)])} {n}')
+                lines.append(f'{full}_bucket{_label_text(labels, [("le", "+Inf")])} {h.count}')
+                lines.append(f'{full}_sum{_label_text(labels)} {h.sum}')
+                lines.append(f'{full}_count{_label_text(labels)} {h.count}')
+            for (name, labels), value in sorted(self.counters.items()):
+                declare(f'{self.prefix}_{name}', 'counter')
+                lines.append(f'{self.prefix}_{name}{_label_text(labels)} {value}')
+            for (name, labels), value in sorted(self.gauges.items()):
+                declare(f'{self.prefix}_{name}', 'gauge')
+                lines.append(f'{self.prefix}_{name}{_label_text(labels)} {value}')
+        declare(f'{self.prefix}_last_run_timestamp_seconds', 'gauge')
+        lines.append(f'{self.prefix}_last_run_timestamp_seconds {time.time()}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """JSON-serialisable run report with per-stage latency and throughput"""
+        duration = time.time() - self.started_at
+        with self._lock:
+            stages = {}
+            for (name, labels), h in self.histograms.items():
+                label = ','.join(f'{k}={v}' for k, v in labels) or name
+                stages[label] = {
+                    'count': h.count, 'total_seconds': round(h.sum, 3), 'max_seconds': round(h.max, 3),
+                    'p50_seconds': round(h.quantile(0.5), 3), 'p95_seconds': round(h.quantile(0.95), 3)
+                }
+            counters = {name + _label_text(labels): value for (name, labels), value in self.counters.items()}
+            gauges = {name + _label_text(labels): value for (name, labels), value in self.gauges.items()}
+            throughput = {}
+            for (name, labels), value in self.counters.items():
+                if name == 'bytes_total' and duration:
+                    throughput[dict(labels).get('direction', 'all')] = round(value / duration / (1024 * 1024), 3)
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': round(duration, 3),
+            'stages': stages,
+            'counters': counters,
+            'gauges': gauges,
+            'throughput_mb_per_second': throughput
+        }
+
+    def _write(self, path, text):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def write_prometheus(self, path):
+        self._write(path, self.prometheus())
+
+    def write_json(self, path):
+        self._write(path, json.dumps(self.report(), indent=2))
+
+
+metrics = Metrics()
@@ -0,0 +1,108 @@
+"""
+Frame-aligned MP3 splitting
+Cuts oversized recordings into parts on MPEG frame boundaries without decoding
+or re-encoding. Only frame headers are parsed, streaming through the file with a
+small read buffer, so memory use does not depend on the recording size.
+"""
+
+_bitrates = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_sample_rates = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+def frame_length(header):
+    """Byte length of the MPEG audio frame starting with these 4 bytes, or None
+    if they are not a valid frame header"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = (header[2] >> 4) & 0x0F
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    bitrate = _bitrates[(1 if version_bits == 3 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _sample_rates[version_bits][rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 3 and version_bits != 3:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+def _id3v2_size(header):
+    """Total size of an ID3v2 tag starting with these 10 bytes, 0 if there is none"""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for b in header[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+def iter_frames(f, buffer_size=64 * 1024):
+    """Yield (offset, length) of every MPEG frame in the binary file f
+
+    Leading ID3v2 tags are skipped and bytes that are not a frame (junk, ID3v1
+    tags) are stepped over one byte at a time until the next valid header.
+    """
+    f.seek(0)
+    pos = _id3v2_size(f.read(10))
+    f.seek(pos)
+    buf = f.read(buffer_size)
+    buf_start = pos
+    while True:
+        i = pos - buf_start
+        if i + 4 > len(buf):
+            f.seek(pos)
+            buf = f.read(buffer_size)
+            buf_start = pos
+            i = 0
+            if len(buf) < 4:
+                return
+        length = frame_length(buf[i:i + 4])
+        if length is None:
+            pos += 1
+            continue
+        yield pos, length
+        pos += length
+
+def split_points(path, max_bytes):
+    """Return (start, end) byte ranges, end exclusive, that cover the whole file
+    with no range larger than max_bytes and every cut on a frame boundary"""
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        if size <= max_bytes:
+            return [(0, size)]
+        ranges = []
+        start = 0
+        for offset, length in iter_frames(f):
+            if offset + length - start > max_bytes and offset > start:
+                ranges.append((start, offset))
+                start = offset
+        ranges.append((start, size))
+    return ranges
+
+def iter_range(path, start, end, chunk_size=1024 * 1024):
+    """Read bytes start..end (exclusive) of the file in chunks"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,181 @@
+import queue
+import threading
+import time
+from metrics import metrics
+
+_done = object()
+
+class StageStats:
+    """Thread-safe counters for one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, nbytes, seconds):
+        with self._lock:
+            self.items += 1
+            self.bytes += nbytes or 0
+            self.busy += seconds
+
+    def fail(self, seconds):
+        with self._lock:
+            self.failures += 1
+            self.busy += seconds
+
+    def summary(self, wall):
+        mb = self.bytes / (1024 * 1024)
+        rate = mb / wall if wall else 0.0
+        return f'{self.name}: {self.items} ok, {self.failures} failed, {mb:.1f} MB, {rate:.2f} MB/s, busy {self.busy:.1f}s'
+
+
+class TransferPipeline:
+    """Bounded producer/consumer pipeline: download workers feed upload workers.
+
+    download(item) -> (result, nbytes) runs on download_workers threads and its
+    results wait in a queue of at most max_pending entries, so downloads stall
+    instead of piling up when uploads are slower. An optional
+    process(item, result) -> result stage (e.g. re-encoding) runs between the
+    two on its own process_workers threads, behind its own bounded queue, so
+    slow processing holds neither download nor upload slots.
+    upload(item, result) -> nbytes runs on upload_workers threads. finish(item) runs on the same upload thread
+    only after upload returned without raising, so an item is never finished
+    before it is uploaded. Exceptions from any stage are passed to
+    on_error(stage_name, item, exc) and the item is dropped.
+    """
+
+    def __init__(self, download, upload, finish=None, on_error=None,
+                 download_workers=2, upload_workers=2, max_pending=None, process=None, process_workers=1):
+        self.download = download
+        self.process = process
+        self.upload = upload
+        self.finish = finish
+        self.on_error = on_error
+        self.download_workers = max(1, download_workers)
+        self.process_workers = max(1, process_workers)
+        self.upload_workers = max(1, upload_workers)
+        self.max_pending = max_pending or self.upload_workers * 2
+        stages = ('download', 'process', 'upload', 'delete') if process else ('download', 'upload', 'delete')
+        self.stats = {name: StageStats(name) for name in stages}
+        self.wall = 0.0
+        self.feed_error = None
+        self._stopping = threading.Event()
+
+    def _run_stage(self, name, fn, *args):
+        start = time.time()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self.stats[name].fail(time.time() - start)
+            if self.on_error:
+                self.on_error(name, args[0], e)
+            return False, None
+        nbytes = result[1] if name == 'download' else result if name == 'upload' else 0
+        self.stats[name].record(nbytes, time.time() - start)
+        return True, result
+
+    def _download_worker(self, todo, ready):
+        while True:
+            item = todo.get()
+            if item is _done:
+                return
+            if self._stopping.is_set():
+                continue
+            ok, result = self._run_stage('download', self.download, item)
+            if ok:
+                ready.put((item, result[0]))
+                metrics.gauge('queue_depth', ready.qsize(), queue='processing' if self.process else 'uploads')
+
+    def _process_worker(self, downloaded, ready):
+        while True:
+            entry = downloaded.get()
+            if entry is _done:
+                return
+            item, result = entry
+            ok, result = self._run_stage('process', self.process, item, result)
+            if ok:
+                ready.put((item, result))
+                metrics.gauge('queue_depth', ready.qsize(), queue='uploads')
+
+    def _upload_worker(self, ready):
+        while True:
+            entry = ready.get()
+            if entry is _done:
+                return
+            item, result = entry
+            ok, _ = self._run_stage('upload', self.upload, item, result)
+            if ok and self.finish:
+                self._run_stage('delete', self.finish, item)
+
+    def _feed(self, items, todo):
+        try:
+            for item in items:
+                if self._stopping.is_set():
+                    break
+                todo.put(item)
+        except Exception as e:
+            self.feed_error = e
+        finally:
+            for _ in range(self.download_workers):
+                todo.put(_done)
+
+    def stop(self):
+        """Stop starting new downloads; downloads and uploads already in flight
+        (and anything waiting for upload) still finish, then run() returns"""
+        self._stopping.set()
+
+    def stopped(self):
+        """True once stop() was called, i.e. the items may not all have been fed"""
+        return self._stopping.is_set()
+
+    def processed(self):
+        """Number of items that reached any stage outcome in this run"""
+        return sum(s.items + s.failures for s in self.stats.values())
+
+    def run(self, items):
+        """Process all items, returns the per-stage StageStats
+
+        items may be a lazy iterator; it is consumed as download workers free up,
+        so the first downloads start before the iterator is exhausted. If the
+        iterator raises, items already queued are finished and the error is
+        re-raised here.
+        """
+        start = time.time()
+        todo = queue.Queue(maxsize=self.download_workers)
+        ready = queue.Queue(maxsize=self.max_pending)
+        # Without a process stage downloads go straight to the upload queue
+        downloaded = queue.Queue(maxsize=self.max_pending) if self.process else ready
+        feeder = threading.Thread(target=self._feed, args=(items, todo), daemon=True)
+
+        downloaders = [threading.Thread(target=self._download_worker, args=(todo, downloaded), daemon=True)
+                       for _ in range(self.download_workers)]
+        processors = [threading.Thread(target=self._process_worker, args=(downloaded, ready), daemon=True)
+                      for _ in range(self.process_workers if self.process else 0)]
+        uploaders = [threading.Thread(target=self._upload_worker, args=(ready,), daemon=True)
+                     for _ in range(self.upload_workers)]
+        for t in [feeder] + downloaders + processors + uploaders:
+            t.start()
+        for t in downloaders:
+            t.join()
+        for _ in processors:
+            downloaded.put(_done)
+        for t in processors:
+            t.join()
+        for _ in uploaders:
+            ready.put(_done)
+        for t in uploaders:
+            t.join()
+
+        self.wall = time.time() - start
+        if self.feed_error is not None:
+            raise self.feed_error
+        return self.stats
+
+    def report(self):
+        lines = [f'⏱ {self.wall:.1f}s total']
+        lines += [s.summary(self.wall) for s in self.stats.values()]
+        return '\n'.join(lines)
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from sessions import fcc_session
+from metrics import metrics
+
+# Bytes pulled from the CDN per read; peak memory of a transfer is bounded by this
+default_chunk_size = 1024 * 1024
+
+class IncompleteDownload(Exception):
+    pass
+
+class RecordingChanged(Exception):
+    pass
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _write_text(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _content_range(r):
+    """Parse 'bytes start-end/total' into (start, total); total is None for '*'"""
+    m = re.match(r'bytes (\d+)-\d+/(\d+|\*)', r.headers.get('Content-Range', ''))
+    if not m:
+        return None, None
+    return int(m.group(1)), None if m.group(2) == '*' else int(m.group(2))
+
+def verify_download(path, expected_size, etag):
+    """Check a finished download against Content-Length and, when the ETag is a
+    plain MD5 digest (as S3-style CDNs send), against its checksum"""
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise IncompleteDownload(f'Size mismatch: got {size} of {expected_size} bytes')
+    digest = (etag or '').strip('"')
+    if re.fullmatch(r'[0-9a-f]{32}', digest) and not etag.startswith('W/'):
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(default_chunk_size), b''):
+                md5.update(block)
+        if md5.hexdigest() != digest:
+            raise IncompleteDownload(f'Checksum mismatch: expected {digest}, got {md5.hexdigest()}')
+
+def download_recording(recording_url, dest, chunk_size=default_chunk_size, max_retries=5, backoff=1.0):
+    """Spool a recording to the file at dest, returns the number of bytes written
+
+    Bytes land in dest + '.part' first. When the connection drops the download
+    resumes from the end of the partial file with a Range request (guarded by
+    If-Range on the ETag so a changed recording restarts from zero), waiting
+    backoff * 2^n seconds between attempts. Partial files survive the process,
+    so the next run resumes them too. max_retries counts consecutive attempts
+    that made no progress. The finished file is checked with verify_download
+    before it is moved to dest.
+    """
+    with metrics.span('download', mode='single'):
+        size = _download_single(recording_url, dest, chunk_size, max_retries, backoff)
+    metrics.count('bytes_total', size, direction='download')
+    return size
+
+def _download_single(recording_url, dest, chunk_size, max_retries, backoff):
+    part = dest + '.part'
+    etag_path = part + '.etag'
+    etag = _read_text(etag_path)
+    expected = None
+    failures = 0
+
+    while True:
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if etag:
+                headers['If-Range'] = etag
+        try:
+            r = fcc_session.get(recording_url+'.mp3', headers=headers, allow_redirects=True, verify=False, stream=True)
+            if r.status_code == 416 and offset:
+                # Nothing left to fetch: the partial file is complete or stale
+                start, total = _content_range(r)
+                if total == offset:
+                    expected = total
+                    break
+                _remove(part, etag_path)
+                continue
+            r.raise_for_status()
+
+            if r.status_code == 206:
+                start, expected = _content_range(r)
+                if start != offset:
+                    print(f'Server resumed at {start} instead of {offset}, restarting download')
+                    _remove(part, etag_path)
+                    continue
+                mode = 'ab'
+            else:
+                offset = 0
+                mode = 'wb'
+                length = r.headers.get('Content-Length')
+                expected = int(length) if length else None
+            if r.headers.get('ETag'):
+                etag = r.headers['ETag']
+                _write_text(etag_path, etag)
+
+            with open(part, mode) as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+            if expected is None or os.path.getsize(part) >= expected:
+                break
+            raise IncompleteDownload(f'Connection closed at {os.path.getsize(part)} of {expected} bytes')
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                requests.HTTPError, IncompleteDownload) as e:
+            if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code < 500:
+                raise
+            progressed = os.path.exists(part) and os.path.getsize(part) > offset
+            failures = 0 if progressed else failures + 1
+            if failures > max_retries:
+                raise
+            delay = min(backoff * 2 ** max(failures - 1, 0), 60)
+            metrics.count('retries_total', stage='download')
+            print(f'Download interrupted ({e}), resuming in {delay:.0f}s')
+            time.sleep(delay)
+
+    try:
+        verify_download(part, expected, etag)
+    except IncompleteDownload:
+        _remove(part, etag_path)
+        raise
+    os.replace(part, dest)
+    _remove(etag_path)
+    return os.path.getsize(dest)
+
+def probe_recording(recording_url):
+    """Ask the server for (size, etag, accepts_ranges) without downloading the body"""
+    r = fcc_session.get(recording_url+'.mp3', headers={'Range': 'bytes=0-0'}, allow_redirects=True, verify=False, stream=True)
+    r.close()
+    r.raise_for_status()
+    etag = r.headers.get('ETag')
+    if r.status_code == 206:
+        start, total = _content_range(r)
+        return total, etag, total is not None
+    length = r.headers.get('Content-Length')
+    accepts = r.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    return int(length) if length else None, etag, accepts
+
+def _fetch_segment(recording_url, path, start, end, etag, chunk_size, max_retries, backoff):
+    """Fetch bytes start..end (inclusive) into the same offsets of the file at path"""
+    pos = start
+    failures = 0
+    with open(path, 'r+b') as f:
+        while pos <= end:
+            headers = {'Range': f'bytes={pos}-{end}'}
+            if etag:
+                headers['If-Range'] = etag
+            before = pos
+            try:
+                r = fcc_session.get(recording_url+'.mp3', headers=headers, allow_redirects=True, verify=False, stream=True)
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise RecordingChanged('Recording changed during segmented download')
+                f.seek(pos)
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    chunk = chunk[:end + 1 - pos]
+                    f.write(chunk)
+                    pos += len(chunk)
+                if pos <= end:
+                    raise IncompleteDownload(f'Segment closed at {pos} of {end + 1}')
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    requests.HTTPError, IncompleteDownload) as e:
+                if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code < 500:
+                    raise
+                failures = 0 if pos > before else failures + 1
+                if failures > max_retries:
+                    raise
+                metrics.count('retries_total', stage='download')
+                time.sleep(min(backoff * 2 ** max(failures - 1, 0), 60))
+    return pos - start
+
+def download_segmented(recording_url, dest, segments=4, chunk_size=default_chunk_size, max_retries=5, backoff=1.0):
+    """Download a recording as `segments` byte ranges fetched in parallel
+
+    The destination is preallocated to its full size and every segment writes
+    straight into its own slice, so nothing is buffered beyond one chunk per
+    connection. Each segment resumes its own range after disconnects. Falls back
+    to the single-stream download_recording when segments <= 1 or the server
+    does not advertise byte ranges. Returns the number of bytes written.
+    """
+    if segments <= 1:
+        return download_recording(recording_url, dest, chunk_size, max_retries, backoff)
+    size, etag, accepts_ranges = probe_recording(recording_url)
+    if not accepts_ranges or not size:
+        return download_recording(recording_url, dest, chunk_size, max_retries, backoff)
+
+    with metrics.span('download', mode='segmented'):
+        _download_segments(recording_url, dest, size, etag, segments, chunk_size, max_retries, backoff)
+    metrics.count('bytes_total', size, direction='download')
+    return size
+
+def _download_segments(recording_url, dest, size, etag, segments, chunk_size, max_retries, backoff):
+    part = dest + '.seg'
+    with open(part, 'wb') as f:
+        f.truncate(size)
+
+    step = -(-size // segments)
+    ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(_fetch_segment, recording_url, part, start, end, etag,
+                                   chunk_size, max_retries, backoff) for start, end in ranges]
+            for future in futures:
+                future.result()
+        verify_download(part, size, etag)
+    except Exception:
+        _remove(part)
+        raise
+    os.replace(part, dest)
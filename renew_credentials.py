@@ -6,15 +6,19 @@ Automates the process of requesting new FCC API credentials every 7 days
 import os
 import re
 import time
+import datetime
+import atexit
+import threading
+from contextlib import contextmanager
 import imaplib
+import socket
 import email
 from email.header import decode_header
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from dotenv import dotenv_values, set_key
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from dotenv import set_key
+import config
 import logging
 from telegram_utils import send_telegram_message
 
@@ -28,10 +32,112 @@ logging.basicConfig(
     ]
 )
 
-class FCCCredentialRenewer:
+class _FormParser(HTMLParser):
+    """Collect the forms, their fields and any CSRF meta token from a page"""
+
     def __init__(self):
-        self.env_file = '.env'
-        self.config = dotenv_values(self.env_file)
+        super().__init__()
+        self.forms = []
+        self.csrf_token = None
+        self._form = None
+        self._textarea = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta' and attrs.get('name') == 'csrf-token':
+            self.csrf_token = attrs.get('content')
+        elif tag == 'form':
+            self._form = {'action': attrs.get('action', ''), 'method': attrs.get('method', 'post'), 'fields': []}
+            self.forms.append(self._form)
+        elif tag in ('input', 'textarea', 'select') and self._form is not None:
+            field = dict(attrs, tag=tag)
+            self._form['fields'].append(field)
+            if tag == 'textarea':
+                self._textarea = field
+
+    def handle_data(self, data):
+        if self._textarea is not None:
+            self._textarea['value'] = self._textarea.get('value', '') + data
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self._form = None
+        elif tag == 'textarea':
+            self._textarea = None
+
+
+def _form_key(field):
+    """Map a form field to name/email/phone/purpose, mirroring the Selenium selectors"""
+    name = (field.get('name') or '').lower()
+    short = name.rsplit('[', 1)[-1].rstrip(']')
+    placeholder = (field.get('placeholder') or '').lower()
+    field_id = (field.get('id') or '').lower()
+    field_type = (field.get('type') or 'text').lower()
+    if field_type == 'email' or short == 'email' or placeholder == 'email':
+        return 'email'
+    if field_type == 'tel' or short == 'phone' or placeholder == 'phone' or 'phone' in field_id:
+        return 'phone'
+    if 'integration' in placeholder or short in ('purpose', 'description', 'message'):
+        return 'purpose'
+    if short == 'name' or placeholder == 'name' or 'name' in field_id:
+        return 'name'
+    return None
+
+
+def _input_matches(shown, typed):
+    """Whether an input shows the typed value, allowing for masks that add or drop
+    punctuation, spaces or a country code around the digits"""
+    if shown.strip() == typed.strip():
+        return True
+    shown_digits, typed_digits = re.sub(r'\D', '', shown), re.sub(r'\D', '', typed)
+    if len(typed_digits) < 7 or len(shown_digits) < 7:
+        return False
+    return shown_digits.endswith(typed_digits) or typed_digits.endswith(shown_digits)
+
+
+# Phrases on the page FCC shows once a request for API access went through
+_SUCCESS_MARKERS = ('thank you', 'request received', 'request has been', 'successfully', 'check your email',
+                    'we will email', "we'll email")
+
+def _submission_confirmed(resp):
+    """Whether a form submission response shows the request was accepted
+
+    A 2xx/3xx alone proves nothing: a rejected submission usually comes back as
+    the form again. JSON answers need a true 'ok' or 'success'; HTML pages must
+    either no longer contain the credential form or carry a success message.
+    """
+    if 'json' in resp.headers.get('Content-Type', ''):
+        try:
+            data = resp.json()
+        except ValueError:
+            return False
+        return isinstance(data, dict) and bool(data.get('ok') or data.get('success')) and not data.get('errors')
+    text = resp.text
+    if any(marker in text.lower() for marker in _SUCCESS_MARKERS):
+        return True
+    parser = _FormParser()
+    parser.feed(text)
+    form_again = any(_form_key(x) == 'email' for f in parser.forms for x in f['fields'])
+    # An empty body confirms nothing either
+    return bool(text.strip()) and not form_again
+
+
+class FCCCredentialRenewer:
+    # Browser shared by all renewals in this process, see get_driver()
+    _driver = None
+    _driver_lock = threading.Lock()
+    # Renewals of different accounts can run at once but take turns in the browser
+    _browser_lock = threading.Lock()
+    # Renewals waiting for or using the browser, guarded by _driver_lock
+    _browser_users = 0
+
+    def __init__(self, env_file=None):
+        """env_file holds one account's settings over the main .env and receives
+        its new credentials; by default the main .env itself is used"""
+        self.env_file = env_file or config.env_file
+        self.step_timings = []
+        # Renewals are rare and rewrite the env file, so start from what is on disk now
+        self.config = config.overlay_config(env_file) if env_file else config.reload_config()
         self.fcc_url = "https://www.freeconferencecall.com/for-developers/free-api?country_code=in&locale=global"
         
         # Get form data from config or set defaults
@@ -43,11 +149,91 @@ class FCCCredentialRenewer:
         }
         
     def request_new_credentials(self):
-        """Automate form submission on FCC website"""
+        """Submit the FCC API access form, over plain HTTP if possible, else with Chrome"""
         logging.info("Starting credential request process...")
         send_telegram_message("🔄 FCC Credential Renewal: Starting form submission...")
-        
+
+        try:
+            with self._step("submit form over HTTP"):
+                submitted = self.request_new_credentials_http()
+            if submitted:
+                return True
+        except Exception as e:
+            logging.warning(f"HTTP form submission failed: {str(e)}")
+        logging.info("Falling back to browser form submission...")
+        cls = FCCCredentialRenewer
+        with cls._driver_lock:
+            cls._browser_users += 1
+        with cls._browser_lock:
+            try:
+                return self.request_new_credentials_browser()
+            finally:
+                with cls._driver_lock:
+                    cls._browser_users -= 1
+                    idle = cls._browser_users == 0
+                if idle:
+                    # Nobody is queued for the browser; don't keep Chrome around until the next renewal
+                    self.close_browser()
+
+    def request_new_credentials_http(self):
+        """Fast path: replay the form submission with a requests session
+
+        Loads the page for its cookies, hidden fields and CSRF token, fills the
+        form and posts it. Returns False when the page has no usable form (for
+        example when it is rendered by JavaScript) or the response does not
+        confirm the request, so the browser path can run.
+        """
+        session = requests.Session()
+        session.headers['User-Agent'] = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        page = session.get(self.fcc_url, timeout=20)
+        page.raise_for_status()
+
+        parser = _FormParser()
+        parser.feed(page.text)
+        form = next((f for f in parser.forms if any(_form_key(x) == 'email' for x in f['fields'])), None)
+        if form is None:
+            logging.info("No credential form in page HTML")
+            return False
+
+        data = {}
+        filled = set()
+        for field in form['fields']:
+            if not field.get('name') or field.get('type') in ('submit', 'button'):
+                continue
+            key = _form_key(field)
+            if key and field.get('type') != 'hidden':
+                data[field['name']] = self.form_data[key]
+                filled.add(key)
+            elif field.get('type') in ('checkbox', 'radio'):
+                if 'checked' in field:
+                    data[field['name']] = field.get('value', 'on')
+            else:
+                data[field['name']] = field.get('value', '')
+        if not {'name', 'email'} <= filled:
+            logging.info(f"Credential form is missing fields, found: {sorted(filled)}")
+            return False
+
+        headers = {'Referer': self.fcc_url}
+        if parser.csrf_token:
+            headers['X-CSRF-Token'] = parser.csrf_token
+        action = urljoin(page.url, form['action'] or page.url)
+        logging.info(f"Submitting form over HTTP to {action}...")
+        resp = session.request(form['method'].upper(), action, data=data, headers=headers, timeout=20)
+        if resp.status_code >= 400:
+            logging.warning(f"Form submission returned HTTP {resp.status_code}")
+            return False
+        if not _submission_confirmed(resp):
+            logging.warning(f"Form submission returned HTTP {resp.status_code} without confirming the request")
+            return False
+
+        logging.info("Form submitted successfully!")
+        send_telegram_message("✅ FCC Form submitted successfully! Waiting for credentials email...")
+        return True
+
+    @staticmethod
+    def _chrome_options():
         # Setup Chrome options for headless mode
+        from selenium.webdriver.chrome.options import Options
         chrome_options = Options()
         chrome_options.add_argument('--headless=new')  # Use new headless mode
         chrome_options.add_argument('--no-sandbox')  # Required for Linux
@@ -56,183 +242,388 @@ class FCCCredentialRenewer:
         chrome_options.add_argument('--window-size=1920,1080')
         chrome_options.add_argument('--disable-blink-features=AutomationControlled')  # Avoid detection
         chrome_options.add_argument('user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-        
-        driver = None
+        return chrome_options
+
+    @classmethod
+    def _create_driver(cls):
+        # Selenium is only imported once a browser is actually needed
+        from selenium import webdriver
+        chrome_options = cls._chrome_options()
+        # Try to initialize ChromeDriver (works on both Linux and Mac)
+        # Selenium 4.6+ has built-in driver management
         try:
-            # Try to initialize ChromeDriver (works on both Linux and Mac)
-            # Selenium 4.6+ has built-in driver management
+            # Try using Selenium's built-in manager first (most reliable for Chrome 115+)
+            from selenium.webdriver.chrome.service import Service
+            service = Service()
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+            logging.info("ChromeDriver initialized using Selenium Manager")
+        except Exception as e1:
+            logging.warning(f"Selenium Manager failed: {str(e1)}")
             try:
-                # Try using Selenium's built-in manager first (most reliable for Chrome 115+)
+                # Fallback to webdriver-manager
                 from selenium.webdriver.chrome.service import Service
-                service = Service()
+                from webdriver_manager.chrome import ChromeDriverManager
+                
+                service = Service(ChromeDriverManager().install())
                 driver = webdriver.Chrome(service=service, options=chrome_options)
-                logging.info("ChromeDriver initialized using Selenium Manager")
-            except Exception as e1:
-                logging.warning(f"Selenium Manager failed: {str(e1)}")
+                logging.info("ChromeDriver initialized using webdriver-manager")
+            except Exception as e2:
+                logging.warning(f"webdriver-manager also failed: {str(e2)}")
                 try:
-                    # Fallback to webdriver-manager
-                    from selenium.webdriver.chrome.service import Service
-                    from webdriver_manager.chrome import ChromeDriverManager
-                    
-                    service = Service(ChromeDriverManager().install())
-                    driver = webdriver.Chrome(service=service, options=chrome_options)
-                    logging.info("ChromeDriver initialized using webdriver-manager")
-                except Exception as e2:
-                    logging.warning(f"webdriver-manager also failed: {str(e2)}")
-                    try:
-                        # Final fallback: try without explicit service
-                        driver = webdriver.Chrome(options=chrome_options)
-                        logging.info("ChromeDriver initialized using system PATH")
-                    except Exception as e3:
-                        logging.error(f"All ChromeDriver methods failed. Last error: {str(e3)}")
-                        raise Exception(
-                            "Could not initialize ChromeDriver. Please ensure Chrome/Chromium is installed.\n"
-                            "For Ubuntu/Debian: sudo apt-get install chromium-browser chromium-chromedriver\n"
-                            "Then run: pip install --upgrade selenium webdriver-manager"
-                        )
-            
-            driver.get(self.fcc_url)
-            
-            # Wait for page to load
-            wait = WebDriverWait(driver, 20)
-            
-            logging.info("Waiting for form to load...")
-            time.sleep(3)  # Wait for page to fully load
+                    # Final fallback: try without explicit service
+                    driver = webdriver.Chrome(options=chrome_options)
+                    logging.info("ChromeDriver initialized using system PATH")
+                except Exception as e3:
+                    logging.error(f"All ChromeDriver methods failed. Last error: {str(e3)}")
+                    raise Exception(
+                        "Could not initialize ChromeDriver. Please ensure Chrome/Chromium is installed.\n"
+                        "For Ubuntu/Debian: sudo apt-get install chromium-browser chromium-chromedriver\n"
+                        "Then run: pip install --upgrade selenium webdriver-manager"
+                    )
+        return driver
+
+    @classmethod
+    def get_driver(cls):
+        """Return the shared browser, starting it if needed
+
+        One Chrome instance is kept per process and reused by renewals queued
+        for it; the last one in the queue shuts it down with close_browser()
+        (also run at exit), so no browser idles between renewals.
+        """
+        with cls._driver_lock:
+            if cls._driver is not None:
+                try:
+                    cls._driver.current_url  # Raises if the browser died
+                    return cls._driver
+                except Exception:
+                    cls._driver = None
+            cls._driver = cls._create_driver()
+            return cls._driver
+
+    @classmethod
+    def close_browser(cls):
+        with cls._driver_lock:
+            if cls._driver is not None:
+                try:
+                    cls._driver.quit()
+                except Exception:
+                    pass
+                cls._driver = None
+
+    @contextmanager
+    def _step(self, name):
+        """Time one renewal step and log it"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.step_timings.append((name, elapsed))
+            logging.info(f"⏱ {name}: {elapsed:.2f}s")
+
+    def timing_report(self):
+        total = sum(t for _, t in self.step_timings)
+        lines = [f"{name}: {t:.2f}s" for name, t in self.step_timings]
+        return "\n".join(lines + [f"total: {total:.2f}s"])
+
+    @staticmethod
+    def _fill(wait, field, value):
+        """Type a value and wait until the page has taken it
+
+        Masked inputs (phone numbers) reformat what was typed, so the value only
+        has to match _input_matches(); if it never does, the field is left as is.
+        """
+        from selenium.common.exceptions import TimeoutException
+        field.clear()
+        field.send_keys(value)
+        try:
+            wait.until(lambda d: _input_matches(field.get_attribute('value') or '', value))
+        except TimeoutException:
+            logging.warning(f"Field shows {field.get_attribute('value')!r} after typing {value!r}, continuing")
+
+    def request_new_credentials_browser(self):
+        """Automate form submission on FCC website
+
+        Every step waits on an explicit page condition instead of a fixed sleep
+        and is timed; see timing_report().
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException
+        driver = None
+        try:
+            with self._step("start browser"):
+                driver = self.get_driver()
+
+            with self._step("load page"):
+                driver.get(self.fcc_url)
+                wait = WebDriverWait(driver, 20)
+                logging.info("Waiting for form to load...")
+                wait.until(lambda d: d.execute_script('return document.readyState') == 'complete')
             
             # Find and fill all form fields
             logging.info("Filling form fields...")
             
             try:
-                # Fill Name field
-                name_field = wait.until(EC.presence_of_element_located(
-                    (By.XPATH, "//input[@placeholder='Name' or @name='name' or contains(@id, 'name')]")))
-                name_field.clear()
-                name_field.send_keys(self.form_data['name'])
-                logging.info(f"✓ Filled name: {self.form_data['name']}")
-                time.sleep(0.5)
+                with self._step("fill name"):
+                    # Fill Name field
+                    name_field = wait.until(EC.visibility_of_element_located(
+                        (By.XPATH, "//input[@placeholder='Name' or @name='name' or contains(@id, 'name')]")))
+                    self._fill(wait, name_field, self.form_data['name'])
+                    logging.info(f"✓ Filled name: {self.form_data['name']}")
                 
-                # Fill Email field
-                email_field = driver.find_element(
-                    By.XPATH, "//input[@placeholder='Email' or @name='email' or @type='email']")
-                email_field.clear()
-                email_field.send_keys(self.form_data['email'])
-                logging.info(f"✓ Filled email: {self.form_data['email']}")
-                time.sleep(0.5)
+                with self._step("fill email"):
+                    # Fill Email field
+                    email_field = wait.until(EC.visibility_of_element_located(
+                        (By.XPATH, "//input[@placeholder='Email' or @name='email' or @type='email']")))
+                    self._fill(wait, email_field, self.form_data['email'])
+                    logging.info(f"✓ Filled email: {self.form_data['email']}")
                 
-                # Fill Phone field
-                phone_field = driver.find_element(
-                    By.XPATH, "//input[@placeholder='Phone' or @name='phone' or contains(@id, 'phone') or @type='tel']")
-                phone_field.clear()
-                phone_field.send_keys(self.form_data['phone'])
-                logging.info(f"✓ Filled phone: {self.form_data['phone']}")
-                time.sleep(0.5)
+                with self._step("fill phone"):
+                    # Fill Phone field
+                    phone_field = wait.until(EC.visibility_of_element_located(
+                        (By.XPATH, "//input[@placeholder='Phone' or @name='phone' or contains(@id, 'phone') or @type='tel']")))
+                    self._fill(wait, phone_field, self.form_data['phone'])
+                    logging.info(f"✓ Filled phone: {self.form_data['phone']}")
                 
-                # Fill Purpose/Integration field (could be textarea or input)
-                purpose_field = driver.find_element(
-                    By.XPATH, "//textarea[@placeholder='Please explain what you are trying to achieve with this integration' or contains(@placeholder, 'integration')] | //input[contains(@placeholder, 'integration')]")
-                purpose_field.clear()
-                purpose_field.send_keys(self.form_data['purpose'])
-                logging.info(f"✓ Filled purpose: {self.form_data['purpose'][:50]}...")
-                time.sleep(1)
+                with self._step("fill purpose"):
+                    # Fill Purpose/Integration field (could be textarea or input)
+                    purpose_field = wait.until(EC.visibility_of_element_located(
+                        (By.XPATH, "//textarea[@placeholder='Please explain what you are trying to achieve with this integration' or contains(@placeholder, 'integration')] | //input[contains(@placeholder, 'integration')]")))
+                    self._fill(wait, purpose_field, self.form_data['purpose'])
+                    logging.info(f"✓ Filled purpose: {self.form_data['purpose'][:50]}...")
                 
             except Exception as e:
                 logging.error(f"Error finding form fields: {str(e)}")
                 logging.info("Trying alternative selectors...")
                 
-                # Fallback: Try to find all input fields and fill them in order
-                inputs = driver.find_elements(By.TAG_NAME, "input")
-                textareas = driver.find_elements(By.TAG_NAME, "textarea")
-                
-                form_values = [self.form_data['name'], self.form_data['email'], self.form_data['phone']]
-                for i, input_field in enumerate(inputs[:3]):
-                    if input_field.is_displayed() and i < len(form_values):
-                        input_field.clear()
-                        input_field.send_keys(form_values[i])
-                        time.sleep(0.5)
-                
-                if textareas:
-                    textareas[0].clear()
-                    textareas[0].send_keys(self.form_data['purpose'])
-                    time.sleep(0.5)
+                with self._step("fill form (fallback)"):
+                    # Fallback: Try to find all input fields and fill them in order
+                    inputs = driver.find_elements(By.TAG_NAME, "input")
+                    textareas = driver.find_elements(By.TAG_NAME, "textarea")
+                    
+                    form_values = [self.form_data['name'], self.form_data['email'], self.form_data['phone']]
+                    for i, input_field in enumerate(inputs[:3]):
+                        if input_field.is_displayed() and i < len(form_values):
+                            self._fill(wait, input_field, form_values[i])
+                    
+                    if textareas:
+                        self._fill(wait, textareas[0], self.form_data['purpose'])
             
             # Submit the form
             logging.info("Submitting form...")
-            submit_button = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//button[contains(text(), 'Request Access')] | //button[@type='submit'] | //input[@type='submit']")
-            ))
-            submit_button.click()
+            with self._step("submit"):
+                submit_button = wait.until(EC.element_to_be_clickable(
+                    (By.XPATH, "//button[contains(text(), 'Request Access')] | //button[@type='submit'] | //input[@type='submit']")
+                ))
+                page_url = driver.current_url
+                submit_button.click()
+            
+            with self._step("confirm submission"):
+                # The page navigates, re-renders or hides the button once the request went through
+                try:
+                    wait.until(lambda d: d.current_url != page_url
+                               or EC.staleness_of(submit_button)(d)
+                               or not submit_button.is_displayed())
+                except TimeoutException:
+                    logging.warning("No page change after submit; assuming the form was accepted")
             
             logging.info("Form submitted successfully!")
             send_telegram_message("✅ FCC Form submitted successfully! Waiting for credentials email...")
-            time.sleep(5)  # Wait for submission
             
             return True
             
         except Exception as e:
             logging.error(f"Error during form submission: {str(e)}")
             send_telegram_message(f"❌ FCC Form submission failed: {str(e)}")
+            if driver is not None:
+                # Don't reuse a browser left in an unknown state
+                self.close_browser()
             return False
-        finally:
-            if driver:
-                driver.quit()
     
-    def check_email_for_credentials(self, max_wait_minutes=10):
-        """Check email for FCC credentials"""
-        logging.info("Checking email for new credentials...")
-        send_telegram_message("📧 Checking email for FCC credentials...")
-        
-        # Email configuration - add these to .env file
+    def _connect_mailbox(self):
         imap_server = self.config.get('IMAP_SERVER', 'imap.gmail.com')
+        use_ssl = self.config.get('IMAP_SSL', 'true').lower() != 'false'
+        imap_port = int(self.config.get('IMAP_PORT') or (993 if use_ssl else 143))
         email_address = self.config['username']
         email_password = self.config.get('EMAIL_PASSWORD', self.config['password'])
+
+        mail = (imaplib.IMAP4_SSL if use_ssl else imaplib.IMAP4)(imap_server, imap_port)
+        mail.login(email_address, email_password)
+        # Capabilities can change after login (e.g. IDLE is often only listed then)
+        status, data = mail.capability()
+        if status == 'OK':
+            mail.capabilities = tuple(data[-1].decode().upper().split())
+        mail.select('inbox')
+        # imaplib keeps SELECT's EXISTS; only later ones mean new mail (see _idle)
+        mail.untagged_responses.pop('EXISTS', None)
+        mail.untagged_responses.pop('RECENT', None)
+        return mail
+
+    @staticmethod
+    def _idle(mail, timeout, done_timeout=30):
+        """Block in IMAP IDLE until the server reports new mail or timeout passes
+
+        imaplib has no IDLE support, so the command is driven by hand: a reader
+        thread consumes untagged responses until the tagged completion while
+        this thread waits for an EXISTS notification, then ends IDLE with DONE.
+        Mail the server announced during the previous commands is already in
+        imaplib's buffer, so that is checked (and cleared) before idling.
+        Returns True if new mail arrived. If the server drops the connection, or
+        doesn't end IDLE within done_timeout seconds, IMAP4.abort is raised so
+        the caller reconnects.
+        """
+        buffered = [mail.untagged_responses.pop(name, None) for name in ('EXISTS', 'RECENT')]
+        if any(buffered):
+            return True
+        tag = mail._new_tag().decode()
+        mail.send(f'{tag} IDLE\r\n'.encode())
+        if not mail.readline().startswith(b'+'):
+            raise imaplib.IMAP4.error('Server refused IDLE')
+
+        new_mail = threading.Event()
+        finished = threading.Event()
+        dropped = threading.Event()
+
+        def read_responses():
+            try:
+                while True:
+                    line = mail.readline()
+                    if not line:
+                        dropped.set()
+                        return
+                    if line.startswith(tag.encode()):
+                        return
+                    if line.startswith(b'*') and (b'EXISTS' in line or b'RECENT' in line):
+                        new_mail.set()
+            except (OSError, imaplib.IMAP4.abort):
+                dropped.set()
+            finally:
+                finished.set()
+                new_mail.set()
+
+        reader = threading.Thread(target=read_responses, daemon=True)
+        reader.start()
+        new_mail.wait(timeout)
+        arrived = not finished.is_set() and new_mail.is_set()
+        if not finished.is_set():
+            mail.send(b'DONE\r\n')
+        if not finished.wait(done_timeout):
+            # The reader would otherwise keep consuming the socket under the next command.
+            # Unblock its readline first: closing the file under it would deadlock
+            try:
+                mail.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            reader.join(5)
+            mail.shutdown()
+            raise imaplib.IMAP4.abort('Server did not end IDLE')
+        if dropped.is_set():
+            mail.shutdown()
+            raise imaplib.IMAP4.abort('Connection lost during IDLE')
+        return arrived
+
+    def _wait_for_new_mail(self, mail, timeout, poll_interval=30, idle_timeout=300):
+        """Wait for new mail with IDLE if the server supports it, else sleep one poll interval
+
+        IDLE is restarted every idle_timeout seconds so a missed notification
+        or a silently dropped connection can't stall the wait.
+        """
+        if 'IDLE' in mail.capabilities:
+            return self._idle(mail, min(timeout, idle_timeout))
+        time.sleep(min(poll_interval, timeout))
+        return None
+
+    def _scan_new_emails(self, mail, since, last_uid, max_candidates=5):
+        """Look at FCC emails newer than last_uid, returns (credentials, last_uid)
+
+        The first scan searches from `since` (an IMAP date); later scans only ask
+        for UIDs above the last one seen. Only the Subject and Date headers are
+        fetched for each new email, and a full body is downloaded only for an
+        email whose subject looks like the credentials email, so a poll costs a
+        few hundred bytes however much FCC mail the mailbox holds.
+        """
+        if last_uid is None:
+            status, data = mail.uid('SEARCH', 'SINCE', since, 'FROM', '"freeconferencecall.com"')
+        else:
+            status, data = mail.uid('SEARCH', 'UID', f'{last_uid + 1}:*', 'FROM', '"freeconferencecall.com"')
+        if status != 'OK':
+            return None, last_uid
+        # "n:*" always matches the newest message, even when its UID is below n
+        uids = [int(u) for u in data[0].split() if last_uid is None or int(u) > last_uid]
+        if not uids:
+            return None, last_uid
+        last_uid = max(uids + [last_uid or 0])
+
+        # Newest first, headers only
+        candidates = sorted(uids)[-max_candidates:]
+        status, data = mail.uid('FETCH', ','.join(map(str, candidates)), '(BODY.PEEK[HEADER.FIELDS (SUBJECT DATE)])')
+        if status != 'OK':
+            return None, last_uid
+        subjects = {}
+        for response_part in data:
+            if isinstance(response_part, tuple):
+                m = re.search(rb'UID (\d+)', response_part[0])
+                if m:
+                    headers = email.message_from_bytes(response_part[1])
+                    subjects[int(m.group(1))] = headers['Subject'] or ''
+
+        for uid in sorted(subjects, reverse=True):
+            # Get email subject
+            subject = decode_header(subjects[uid])[0][0]
+            if isinstance(subject, bytes):
+                subject = subject.decode()
+            
+            # Check if this is the credentials email
+            if 'api' in subject.lower() or 'credential' in subject.lower():
+                status, msg_data = mail.uid('FETCH', str(uid), '(BODY.PEEK[])')
+                for response_part in msg_data:
+                    if isinstance(response_part, tuple):
+                        msg = email.message_from_bytes(response_part[1])
+                        # Extract credentials from email body
+                        credentials = self._extract_credentials_from_email(msg)
+                        if credentials:
+                            return credentials, last_uid
+        return None, last_uid
+
+    def check_email_for_credentials(self, max_wait_minutes=10, poll_interval=30):
+        """Check email for FCC credentials
+
+        Between checks the mailbox is watched with IMAP IDLE, so a new email is
+        seen as soon as it arrives; servers without IDLE are polled every
+        poll_interval seconds.
+        """
+        logging.info("Checking email for new credentials...")
+        send_telegram_message("📧 Checking email for FCC credentials...")
         
         try:
-            # Connect to email server
-            mail = imaplib.IMAP4_SSL(imap_server)
-            mail.login(email_address, email_password)
-            mail.select('inbox')
+            # Connect to email server (settings in .env: IMAP_SERVER, IMAP_PORT, IMAP_SSL)
+            mail = self._connect_mailbox()
             
             # Search for recent FCC emails
             # Wait up to max_wait_minutes for the email to arrive
             start_time = time.time()
-            credentials_found = False
+            since = (datetime.date.today() - datetime.timedelta(days=1)).strftime('%d-%b-%Y')
+            last_uid = None
             
             while (time.time() - start_time) < (max_wait_minutes * 60):
-                # Search for emails from FCC
-                status, messages = mail.search(None, 'FROM "freeconferencecall.com"')
-                
-                if status == 'OK':
-                    email_ids = messages[0].split()
-                    
-                    # Check the most recent emails (last 5)
-                    for email_id in email_ids[-5:]:
-                        status, msg_data = mail.fetch(email_id, '(RFC822)')
-                        
-                        for response_part in msg_data:
-                            if isinstance(response_part, tuple):
-                                msg = email.message_from_bytes(response_part[1])
-                                
-                                # Get email subject
-                                subject = decode_header(msg['Subject'])[0][0]
-                                if isinstance(subject, bytes):
-                                    subject = subject.decode()
-                                
-                                # Check if this is the credentials email
-                                if 'api' in subject.lower() or 'credential' in subject.lower():
-                                    # Extract credentials from email body
-                                    credentials = self._extract_credentials_from_email(msg)
-                                    
-                                    if credentials:
-                                        logging.info("Credentials found in email!")
-                                        send_telegram_message("✅ Credentials received! Updating .env file...")
-                                        credentials_found = True
-                                        mail.close()
-                                        mail.logout()
-                                        return credentials
+                credentials, last_uid = self._scan_new_emails(mail, since, last_uid)
+                if credentials:
+                    logging.info("Credentials found in email!")
+                    send_telegram_message("✅ Credentials received! Updating .env file...")
+                    mail.close()
+                    mail.logout()
+                    return credentials
                 
-                if not credentials_found:
+                remaining = max_wait_minutes * 60 - (time.time() - start_time)
+                if remaining > 0:
                     logging.info(f"Waiting for email... ({int(time.time() - start_time)}s)")
-                    time.sleep(30)  # Check every 30 seconds
+                    try:
+                        self._wait_for_new_mail(mail, remaining, poll_interval)
+                    except imaplib.IMAP4.abort as e:
+                        logging.warning(f"IMAP connection lost ({e}), reconnecting...")
+                        mail = self._connect_mailbox()
             
             mail.close()
             mail.logout()
@@ -311,6 +702,8 @@ class FCCCredentialRenewer:
             
             set_key(env_path, 'client_id', credentials['client_id'])
             set_key(env_path, 'client_secret', credentials['client_secret'])
+            # Lets FCC start the next renewal before these expire
+            set_key(env_path, 'credentials_renewed_at', str(int(time.time())))
             
             logging.info("✓ .env file updated successfully!")
             logging.info(f"New client_id: {credentials['client_id']}")
@@ -330,6 +723,7 @@ class FCCCredentialRenewer:
         logging.info("=" * 50)
         
         send_telegram_message("🚀 FCC Credential Renewal Process Started")
+        self.step_timings = []
         
         # Step 1: Request new credentials
         if not self.request_new_credentials():
@@ -337,7 +731,8 @@ class FCCCredentialRenewer:
             return False
         
         # Step 2: Check email for credentials
-        credentials = self.check_email_for_credentials()
+        with self._step("wait for email"):
+            credentials = self.check_email_for_credentials()
         
         if not credentials:
             logging.error("Failed to retrieve credentials from email. Aborting.")
@@ -351,12 +746,16 @@ class FCCCredentialRenewer:
         logging.info("=" * 50)
         logging.info("Credential renewal completed successfully!")
         logging.info("=" * 50)
+        logging.info("Renewal step timings:\n" + self.timing_report())
         
-        send_telegram_message("🎉 FCC Credential Renewal Completed Successfully!")
+        send_telegram_message(f"🎉 FCC Credential Renewal Completed Successfully!\n<pre>{self.timing_report()}</pre>")
         
         return True
 
 
+atexit.register(FCCCredentialRenewer.close_browser)
+
+
 def main():
     """Run the credential renewal process"""
     renewer = FCCCredentialRenewer()
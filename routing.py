@@ -0,0 +1,61 @@
+import json
+from datetime import datetime
+
+_weekdays = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+class Route:
+    """One delivery rule: send matching recordings to chat_id.
+
+    Every condition that is set must hold: conferences (list of conference
+    ids), since / until (YYYY-MM-DD, inclusive, on the conference start date)
+    and weekdays (e.g. ["mon", "fri"]). A route without conditions matches
+    every recording.
+    """
+
+    def __init__(self, chat_id, conferences=None, since=None, until=None, weekdays=None):
+        self.chat_id = str(chat_id)
+        self.conferences = {str(id) for id in conferences} if conferences else None
+        self.since = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+        self.until = datetime.strptime(until, '%Y-%m-%d').date() if until else None
+        self.weekdays = {_weekdays.index(d.lower()[:3]) for d in weekdays} if weekdays else None
+
+    def matches(self, c):
+        if self.conferences is not None and str(c['id']) not in self.conferences:
+            return False
+        day = datetime.fromtimestamp(c.get('start_time', 0)).date()
+        if self.since and day < self.since:
+            return False
+        if self.until and day > self.until:
+            return False
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return False
+        return True
+
+
+class Router:
+    """Decides which chats get each recording.
+
+    Routes come from a JSON file holding a list of Route fields, e.g.
+    [{"chat_id": "-1001"}, {"chat_id": "-1002", "conferences": [123]}].
+    Without a file, or when no route matches, recordings go to default_chat
+    so nothing is deleted from FCC without being delivered somewhere.
+    """
+
+    def __init__(self, routes, default_chat):
+        self.routes = routes
+        self.default_chat = str(default_chat)
+
+    @classmethod
+    def load(cls, path, default_chat):
+        if not path:
+            return cls([], default_chat)
+        with open(path) as f:
+            return cls([Route(**r) for r in json.load(f)], default_chat)
+
+    def destinations(self, c):
+        """Chat ids for conference c, in route order without repeats"""
+        chats = []
+        for route in self.routes:
+            if route.chat_id not in chats and route.matches(c):
+                chats.append(route.chat_id)
+        return chats or [self.default_chat]
@@ -0,0 +1,56 @@
+import threading
+from collections import deque
+
+class FairScheduler:
+    """Merge several item iterators into one, taking turns between them.
+
+    sources is a list of (name, iterator, limit). At most `limit` items of a
+    source are in flight at once (None for no cap); call release(name) when one
+    is finished. Sources at their cap are skipped rather than waited on, so a
+    busy or slow source never holds up the others. Iterating yields
+    (name, item) and ends when every source is exhausted, or once stopped()
+    returns true. An exception from one source is kept in errors[name] and only
+    ends that source.
+    """
+
+    def __init__(self, sources, stopped=None):
+        self.sources = list(sources)
+        self.stopped = stopped or (lambda: False)
+        self.limits = {name: limit for name, _, limit in self.sources}
+        self.in_flight = {name: 0 for name, _, _ in self.sources}
+        self.errors = {}
+        self._cond = threading.Condition()
+
+    def release(self, name):
+        with self._cond:
+            self.in_flight[name] -= 1
+            self._cond.notify_all()
+
+    def _has_room(self, name):
+        limit = self.limits[name]
+        return limit is None or self.in_flight[name] < limit
+
+    def __iter__(self):
+        turns = deque((name, iter(items)) for name, items, _ in self.sources)
+        while turns and not self.stopped():
+            with self._cond:
+                # Wait until some source is under its cap; items dropped by a
+                # stopping consumer are never released, so keep checking stopped()
+                while not any(self._has_room(name) for name, _ in turns):
+                    if self.stopped():
+                        return
+                    self._cond.wait(0.5)
+                while not self._has_room(turns[0][0]):
+                    turns.rotate(-1)
+            name, items = turns.popleft()
+            try:
+                item = next(items)
+            except StopIteration:
+                continue
+            except Exception as e:
+                self.errors[name] = e
+                continue
+            with self._cond:
+                self.in_flight[name] += 1
+            turns.append((name, items))
+            yield name, item
@@ -0,0 +1,37 @@
+import requests
+from requests.adapters import HTTPAdapter
+from config import get_config
+
+config = get_config()
+
+class PooledSession(requests.Session):
+    """requests.Session with a sized keep-alive connection pool and a default timeout.
+
+    Reusing one session per host keeps TCP+TLS connections open between calls
+    instead of paying a fresh handshake for every request.
+    """
+
+    def __init__(self, pool_size=10, timeout=(10, 60)):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+# freeconferencecall.com: API calls and recording downloads
+fcc_session = PooledSession(
+    pool_size=int(config.get('FCC_POOL_SIZE') or 10),
+    timeout=(10, float(config.get('FCC_TIMEOUT') or 60))
+)
+
+# api.telegram.org: messages and uploads
+telegram_session = PooledSession(
+    pool_size=int(config.get('TELEGRAM_POOL_SIZE') or 10),
+    timeout=(10, float(config.get('TELEGRAM_TIMEOUT') or 60))
+)
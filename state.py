@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+import time
+
+class StateIndex:
+    """Durable per-recording progress, keyed by (conference id, recording url).
+
+    Each recording moves through downloaded -> uploaded -> deleted. A rerun looks
+    up the row and resumes at the first step that has not happened yet, so a
+    recording whose conference failed to delete is never uploaded twice.
+    Lookups go through the primary key index and stay constant-time in practice
+    at tens of thousands of rows. The database runs in WAL mode so readers never
+    block the writer, and one connection is shared by all pipeline threads.
+    """
+
+    def __init__(self, path='state.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS recordings (
+                conference_id TEXT NOT NULL,
+                recording_url TEXT NOT NULL,
+                downloaded_at REAL,
+                bytes INTEGER,
+                uploaded_at REAL,
+                file_id TEXT,
+                deleted_at REAL,
+                PRIMARY KEY (conference_id, recording_url)
+            ) WITHOUT ROWID
+        ''')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS deliveries (
+                conference_id TEXT NOT NULL,
+                recording_url TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                file_ids TEXT,
+                delivered_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                PRIMARY KEY (conference_id, recording_url, chat_id)
+            ) WITHOUT ROWID
+        ''')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS cursors (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def get(self, conference_id, recording_url):
+        """Return the recording's row as a dict, or None if it was never seen"""
+        with self._lock:
+            cur = self._db.execute(
+                'SELECT * FROM recordings WHERE conference_id = ? AND recording_url = ?',
+                (str(conference_id), recording_url)
+            )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return dict(zip([d[0] for d in cur.description], row))
+
+    def _mark(self, conference_id, recording_url, **fields):
+        cols = ', '.join(fields)
+        marks = ', '.join('?' for _ in fields)
+        updates = ', '.join(f'{k} = excluded.{k}' for k in fields)
+        with self._lock:
+            self._db.execute(
+                f'INSERT INTO recordings (conference_id, recording_url, {cols}) VALUES (?, ?, {marks}) '
+                f'ON CONFLICT (conference_id, recording_url) DO UPDATE SET {updates}',
+                (str(conference_id), recording_url, *fields.values())
+            )
+
+    def mark_downloaded(self, conference_id, recording_url, nbytes):
+        self._mark(conference_id, recording_url, downloaded_at=time.time(), bytes=nbytes)
+
+    def mark_uploaded(self, conference_id, recording_url, file_id):
+        self._mark(conference_id, recording_url, uploaded_at=time.time(), file_id=file_id)
+
+    def mark_deleted(self, conference_id, recording_url):
+        self._mark(conference_id, recording_url, deleted_at=time.time())
+
+    def deliveries(self, conference_id, recording_url):
+        """Per-chat delivery rows of a recording, as {chat_id: dict}"""
+        with self._lock:
+            cur = self._db.execute(
+                'SELECT * FROM deliveries WHERE conference_id = ? AND recording_url = ?',
+                (str(conference_id), recording_url)
+            )
+            names = [d[0] for d in cur.description]
+            return {row[2]: dict(zip(names, row)) for row in cur.fetchall()}
+
+    def mark_delivered(self, conference_id, recording_url, chat_id, file_ids):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO deliveries (conference_id, recording_url, chat_id, file_ids, delivered_at, attempts) '
+                'VALUES (?, ?, ?, ?, ?, 1) ON CONFLICT (conference_id, recording_url, chat_id) DO UPDATE SET '
+                'file_ids = excluded.file_ids, delivered_at = excluded.delivered_at, attempts = attempts + 1, '
+                'last_error = NULL',
+                (str(conference_id), recording_url, str(chat_id), file_ids, time.time())
+            )
+
+    def mark_delivery_failed(self, conference_id, recording_url, chat_id, error):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO deliveries (conference_id, recording_url, chat_id, attempts, last_error) '
+                'VALUES (?, ?, ?, 1, ?) ON CONFLICT (conference_id, recording_url, chat_id) DO UPDATE SET '
+                'attempts = attempts + 1, last_error = excluded.last_error',
+                (str(conference_id), recording_url, str(chat_id), error)
+            )
+
+    def get_cursor(self, name):
+        """Return a saved listing position (e.g. a start_time), or None"""
+        with self._lock:
+            row = self._db.execute('SELECT value FROM cursors WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, name, value):
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO cursors (name, value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET value = excluded.value',
+                (name, value)
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
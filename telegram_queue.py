@@ -0,0 +1,161 @@
+import atexit
+import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` sends per second with bursts of `capacity`.
+
+    pause() stops every caller until a deadline, used for Telegram's retry_after.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                wait = self._wait_time()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class MessageQueue:
+    """Background sender that batches status messages into digests.
+
+    put() returns immediately. The worker waits `coalesce` seconds after the
+    first queued message so a burst (job start, several failures, renewal
+    progress) goes out as one message of up to `max_length` characters, then
+    sends through the per-chat and global buckets. send(chat_id, text) must
+    return (ok, retry_after); a 429's retry_after pauses that chat's bucket and
+    the digest is retried. Only when a second chat is throttled while the first
+    is still paused is the limit taken to be the bot-wide one and the global
+    bucket paused too. Uploads share the buckets but never wait behind queued
+    messages. Pending messages are flushed at interpreter exit. chat_rate may
+    be a function of chat_id, for limits that differ between groups and users.
+    """
+
+    def __init__(self, send, global_bucket, chat_rate=1.0, coalesce=2.0, max_length=4096, max_attempts=5):
+        self.send = send
+        self.global_bucket = global_bucket
+        self.chat_rate = chat_rate
+        self.coalesce = coalesce
+        self.max_length = max_length
+        self.max_attempts = max_attempts
+        self.chat_buckets = {}
+        self.throttled = {}
+        self.pending = []
+        self.busy = False
+        self._cond = threading.Condition()
+        self._worker = None
+        atexit.register(self.flush)
+
+    def bucket_for(self, chat_id):
+        with self._cond:
+            if chat_id not in self.chat_buckets:
+                rate = self.chat_rate(chat_id) if callable(self.chat_rate) else self.chat_rate
+                self.chat_buckets[chat_id] = TokenBucket(rate)
+            return self.chat_buckets[chat_id]
+
+    def acquire(self, chat_id):
+        """Block until one send to chat_id is allowed"""
+        self.bucket_for(chat_id).acquire()
+        self.global_bucket.acquire()
+
+    def retry_after(self, chat_id, seconds):
+        """Pause chat_id after a 429; chat_id=None (or two chats at once) pauses every chat"""
+        now = time.monotonic()
+        with self._cond:
+            self.throttled = {c: until for c, until in self.throttled.items() if until > now and c != chat_id}
+            bot_wide = chat_id is None or bool(self.throttled)
+            if chat_id is not None:
+                self.throttled[chat_id] = now + seconds
+        if chat_id is not None:
+            self.bucket_for(chat_id).pause(seconds)
+        if bot_wide:
+            self.global_bucket.pause(seconds)
+
+    def put(self, chat_id, text):
+        with self._cond:
+            self.pending.append((chat_id, text))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+
+    def _digests(self, batch):
+        """Group queued (chat_id, text) into as few messages per chat as fit"""
+        digests = []
+        current = {}
+        for chat_id, text in batch:
+            joined = current.get(chat_id)
+            if joined is not None and len(joined) + 2 + len(text) <= self.max_length:
+                current[chat_id] = joined + '\n\n' + text
+            else:
+                if joined is not None:
+                    digests.append((chat_id, joined))
+                current[chat_id] = text
+        digests.extend(current.items())
+        return digests
+
+    def _deliver(self, chat_id, text):
+        for _ in range(self.max_attempts):
+            self.acquire(chat_id)
+            ok, retry_after = self.send(chat_id, text)
+            if ok:
+                return True
+            if retry_after is None:
+                return False
+            print(f"Telegram rate limit hit, retrying in {retry_after}s")
+            self.retry_after(chat_id, retry_after)
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self.pending:
+                    self._cond.wait(timeout=30)
+                    if not self.pending:
+                        self._worker = None
+                        return
+                self.busy = True
+            time.sleep(self.coalesce)
+            with self._cond:
+                batch, self.pending = self.pending, []
+            for chat_id, text in self._digests(batch):
+                self._deliver(chat_id, text)
+            with self._cond:
+                self.busy = False
+                self._cond.notify_all()
+
+    def flush(self, timeout=120):
+        """Wait until every queued message has been sent (or given up on)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.pending or self.busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
@@ -1,42 +1,283 @@
-import requests
-from dotenv import dotenv_values
+import os
+import uuid
+import hashlib
+from sessions import telegram_session
+from telegram_queue import TokenBucket, MessageQueue
+from metrics import metrics
+from config import get_config
+from file_cache import FileIdCache
 
-config = dotenv_values(".env")
+config = get_config()
 
 # Telegram Bot Configuration
 bot_token = config['TELEGRAM_BOT_TOKEN']
 chat_id = config['TELEGRAM_CHAT_ID']
+# Point TELEGRAM_API_URL at a self-hosted Bot API server (telegram-bot-api --local)
+# and set TELEGRAM_UPLOAD_MODE=local to hand it spooled files by path instead of
+# uploading their bytes; this also lifts the upload limit from 50 MB to 2000 MB.
+api_base = (config.get('TELEGRAM_API_URL') or 'https://api.telegram.org').rstrip('/')
+upload_mode = (config.get('TELEGRAM_UPLOAD_MODE') or 'multipart').lower()
 
-def send_telegram_message(message):
-    """Send message using Telegram Bot API"""
+class MultipartStream:
+    """multipart/form-data request body that pulls the file part from an iterator.
+
+    requests sends iterables chunk by chunk, so only one chunk of the file is
+    held in memory at a time. When the file size is known the total length is
+    exposed via `len` and the upload is sent with a Content-Length header,
+    otherwise it falls back to chunked transfer encoding.
+    """
+
+    def __init__(self, fields, file_field, filename, chunks, file_size=None, mime_type='audio/mpeg'):
+        self.boundary = uuid.uuid4().hex
+        head = b''
+        for name, value in fields.items():
+            head += (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'
+            ).encode('utf-8')
+        head += (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'
+        ).encode('utf-8')
+        self.head = head
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.chunks = chunks
+        self.len = len(head) + file_size + len(self.tail) if file_size is not None else None
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __iter__(self):
+        yield self.head
+        for chunk in self.chunks:
+            if chunk:
+                yield chunk
+        yield self.tail
+
+def retry_after(response):
+    """Seconds Telegram asks us to wait on a 429, None for any other response"""
+    if response.status_code != 429:
+        return None
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        return float(response.json().get('parameters', {}).get('retry_after', 1))
+    except ValueError:
+        return 1.0
+
+def post_message(target_chat, message):
+    """Send one message right away, returns (ok, retry_after)"""
+    try:
+        url = f"{api_base}/bot{bot_token}/sendMessage"
         payload = {
-            'chat_id': chat_id,
+            'chat_id': target_chat,
             'text': message,
             'parse_mode': 'HTML'
         }
-        response = requests.post(url, json=payload, timeout=10)
+        with metrics.span('telegram_message'):
+            response = telegram_session.post(url, json=payload, timeout=10)
         if response.status_code != 200:
             print(f"Telegram API error: {response.status_code} - {response.text}")
-        return response.status_code == 200
+        if retry_after(response) is not None:
+            metrics.count('retries_total', stage='telegram_message')
+        return response.status_code == 200, retry_after(response)
     except Exception as e:
         print(f"Failed to send Telegram message: {str(e)}")
+        return False, None
+
+# Telegram allows ~30 sends/s per bot, ~1/s per private chat and ~20/min per group
+def default_chat_rate(chat):
+    return 20 / 60 if str(chat).startswith('-') else 1
+
+global_bucket = TokenBucket(float(config.get('TELEGRAM_GLOBAL_RATE') or 30), capacity=30)
+message_queue = MessageQueue(
+    post_message, global_bucket,
+    chat_rate=float(config.get('TELEGRAM_CHAT_RATE') or 0) or default_chat_rate,
+    coalesce=float(config.get('TELEGRAM_COALESCE_SECONDS') or 2)
+)
+
+# Uploaded content by SHA-256, so identical recordings are re-sent by file_id
+file_cache = FileIdCache(
+    config.get('FILE_ID_CACHE') or '.file_ids.json',
+    max_entries=int(config.get('FILE_ID_CACHE_SIZE') or 10000),
+    ttl=float(config.get('FILE_ID_CACHE_TTL') or 30 * 24 * 3600)
+)
+
+def send_telegram_message(message, wait=False):
+    """Queue a message using Telegram Bot API
+
+    Messages are sent from a background thread within the chat's rate limit and
+    bursts are merged into one digest. Pass wait=True to block until sent.
+    """
+    message_queue.put(chat_id, message)
+    metrics.gauge('queue_depth', len(message_queue.pending), queue='telegram_messages')
+    if wait:
+        return message_queue.flush()
+    return True
+
+def sent_file_id(resp):
+    """Pull the file_id out of a sendAudio/sendDocument response"""
+    message = resp.get('result', {})
+    for kind in ('audio', 'voice', 'document'):
+        if kind in message:
+            return message[kind]['file_id']
+    return True
+
+def file_id_rejected(response):
+    """True when a 400 says the file_id is unknown or expired, not the chat or request"""
+    if response.status_code != 400:
+        return False
+    try:
+        description = response.json().get('description', '')
+    except ValueError:
+        return False
+    return any(m in description.lower() for m in ('file identifier', 'file_id', 'file_reference'))
+
+# kind of a file send: 'audio' (sendAudio) or 'voice' (sendVoice, Ogg/Opus voice message)
+send_methods = {'audio': 'sendAudio', 'voice': 'sendVoice'}
+
+def send_telegram_file_id(file_id, filename, target_chat=None, kind='audio'):
+    """Send audio that Telegram already stores, by its file_id (no upload)
+
+    Used to re-send a recording, or to pass one upload on to more chats.
+    Returns the file_id, None when Telegram rejects the file_id itself (the
+    file is gone and must be uploaded again), or False on any other failure.
+    """
+    target_chat = target_chat or chat_id
+    try:
+        url = f"{api_base}/bot{bot_token}/{send_methods[kind]}"
+        data = {
+            'chat_id': target_chat,
+            kind: file_id,
+            'caption': f'📼 Recording: {filename}'
+        }
+        message_queue.acquire(target_chat)
+        with metrics.span('telegram_upload', mode='file_id'):
+            response = telegram_session.post(url, data=data)
+        if retry_after(response) is not None:
+            metrics.count('retries_total', stage='telegram_upload')
+            message_queue.retry_after(target_chat, retry_after(response))
+        if response.status_code != 200:
+            print(f"Telegram API error: {response.status_code} - {response.text}")
+            metrics.count('stage_errors_total', stage='telegram_upload')
+            return None if file_id_rejected(response) else False
+        return sent_file_id(response.json())
+    except Exception as e:
+        print(f"Failed to send Telegram file: {str(e)}")
         return False
 
-def send_telegram_file(file_content, filename):
-    """Send audio file using Telegram Bot API"""
+def _send_cached(digest, filename, target_chat, kind):
+    """Re-send content seen before by its cached file_id
+
+    Returns None when the content has to be uploaded (cache miss, or Telegram
+    no longer knows the file_id), otherwise the result of the file_id send;
+    a failure for another reason (429, bad chat, timeout) keeps the entry.
+    """
+    if not digest:
+        return None
+    file_id = file_cache.get(digest)
+    if file_id:
+        sent = send_telegram_file_id(file_id, filename, target_chat, kind)
+        if sent is not None:
+            metrics.count('file_id_cache_total', result='hit')
+            return sent
+        # Telegram dropped the file; upload it again
+        file_cache.discard(digest)
+    metrics.count('file_id_cache_total', result='miss')
+    return None
+
+def _hashed(chunks, h):
+    for chunk in chunks:
+        h.update(chunk)
+        yield chunk
+
+def send_telegram_file(file_content, filename, file_size=None, digest=None, target_chat=None, kind='audio'):
+    """Send audio file using Telegram Bot API
+
+    file_content may be bytes or an iterator of byte chunks (e.g. a streaming
+    download); chunks are forwarded to Telegram as they arrive. Pass file_size
+    for iterators so the upload can be sent with a Content-Length.
+    The content's SHA-256 is recorded with the returned file_id; when digest
+    (hex SHA-256) is passed it is trusted instead of hashing the stream, and
+    if it was uploaded before the file is re-sent by file_id and file_content
+    is never read. target_chat defaults to
+    TELEGRAM_CHAT_ID; kind='voice' sends an Ogg/Opus file as a voice message.
+    Returns the Telegram file_id of the uploaded audio, or False on failure.
+    """
+    target_chat = target_chat or chat_id
+    sent = _send_cached(digest, filename, target_chat, kind)
+    if sent is not None:
+        return sent
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendAudio"
-        files = {
-            'audio': (filename, file_content, 'audio/mpeg')
+        url = f"{api_base}/bot{bot_token}/{send_methods[kind]}"
+        if isinstance(file_content, bytes):
+            file_size = len(file_content)
+            file_content = [file_content]
+        h = None
+        if not digest:
+            h = hashlib.sha256()
+            file_content = _hashed(file_content, h)
+        data = {
+            'chat_id': target_chat,
+            'caption': f'📼 Recording: {filename}'
         }
+        mime_type = 'audio/ogg' if filename.endswith('.ogg') else 'audio/mpeg'
+        body = MultipartStream(data, kind, filename, file_content, file_size, mime_type)
+        message_queue.acquire(target_chat)
+        with metrics.span('telegram_upload', mode='multipart'):
+            response = telegram_session.post(url, data=body, headers={'Content-Type': body.content_type})
+        if retry_after(response) is not None:
+            metrics.count('retries_total', stage='telegram_upload')
+            message_queue.retry_after(target_chat, retry_after(response))
+        if response.status_code != 200:
+            print(f"Telegram API error: {response.status_code} - {response.text}")
+            metrics.count('stage_errors_total', stage='telegram_upload')
+            return False
+        metrics.count('bytes_total', body.len - len(body.head) - len(body.tail) if body.len else 0, direction='upload')
+        file_id = sent_file_id(response.json())
+        if isinstance(file_id, str):
+            file_cache.put(digest or h.hexdigest(), file_id)
+        return file_id
+    except Exception as e:
+        print(f"Failed to send Telegram file: {str(e)}")
+        return False
+
+def send_telegram_file_path(path, filename, digest=None, target_chat=None, kind='audio'):
+    """Send a recording that is already on disk by path (local Bot API server only)
+
+    The server reads the file itself, so no bytes go over HTTP. As with
+    send_telegram_file, a digest seen before is re-sent by file_id. Returns the
+    Telegram file_id, or False on failure.
+    """
+    target_chat = target_chat or chat_id
+    sent = _send_cached(digest, filename, target_chat, kind)
+    if sent is not None:
+        return sent
+    try:
+        url = f"{api_base}/bot{bot_token}/{send_methods[kind]}"
         data = {
-            'chat_id': chat_id,
+            'chat_id': target_chat,
+            kind: 'file://' + os.path.abspath(path),
             'caption': f'📼 Recording: {filename}'
         }
-        response = requests.post(url, files=files, data=data, timeout=60)
-        return response.status_code == 200
+        if kind == 'audio':
+            data['title'] = os.path.splitext(filename)[0]
+        message_queue.acquire(target_chat)
+        with metrics.span('telegram_upload', mode='local'):
+            response = telegram_session.post(url, data=data)
+        if retry_after(response) is not None:
+            metrics.count('retries_total', stage='telegram_upload')
+            message_queue.retry_after(target_chat, retry_after(response))
+        if response.status_code != 200:
+            print(f"Telegram API error: {response.status_code} - {response.text}")
+            metrics.count('stage_errors_total', stage='telegram_upload')
+            return False
+        metrics.count('bytes_total', os.path.getsize(path), direction='upload_local')
+        file_id = sent_file_id(response.json())
+        if digest and isinstance(file_id, str):
+            file_cache.put(digest, file_id)
+        return file_id
     except Exception as e:
         print(f"Failed to send Telegram file: {str(e)}")
         return False
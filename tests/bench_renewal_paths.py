@@ -0,0 +1,64 @@
+"""
+Credential Renewal Benchmark
+Times the HTTP fast path and the Selenium fallback of
+FCCCredentialRenewer.request_new_credentials against a local mock of the FCC
+developer page. The Selenium path is skipped when Chrome is not installed.
+
+Run: python tests/bench_renewal_paths.py [runs]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.dirname(TESTS))
+from fake_servers import DeveloperPageHandler, start_server
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        if not fn():
+            return None
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    server, base_url = start_server(DeveloperPageHandler)
+
+    workdir = tempfile.mkdtemp(prefix='bench-renewal-')
+    with open(os.path.join(workdir, '.env'), 'w') as f:
+        f.write('TELEGRAM_BOT_TOKEN=bench\nTELEGRAM_CHAT_ID=1\nusername=bench@example.com\n'
+                f'TELEGRAM_API_URL={base_url}\nTELEGRAM_COALESCE_SECONDS=0\n')
+    os.chdir(workdir)
+
+    from renew_credentials import FCCCredentialRenewer
+    renewer = FCCCredentialRenewer()
+    renewer.fcc_url = f'{base_url}/for-developers/free-api'
+
+    http_time = timed(renewer.request_new_credentials_http, runs)
+    print("=" * 50)
+    print(f"Credential renewal form submission ({runs} runs)")
+    print("=" * 50)
+    print(f"HTTP fast path : {http_time * 1000:9.1f} ms/run" if http_time else "HTTP fast path : failed")
+    print(f"Submissions accepted by mock: {len(server.submissions)}")
+
+    browser_time = timed(renewer.request_new_credentials_browser, 1)
+    if browser_time is None:
+        print("Selenium path  : skipped (Chrome/ChromeDriver not available)")
+    else:
+        print(f"Selenium path  : {browser_time * 1000:9.1f} ms/run")
+        if http_time:
+            print(f"Speedup        : {browser_time / http_time:9.1f}x")
+
+    from telegram_utils import message_queue
+    message_queue.flush()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
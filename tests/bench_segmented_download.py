@@ -0,0 +1,46 @@
+"""
+Segmented Download Benchmark
+Downloads one recording from a local server that throttles every connection,
+using 1, 2, 4 and 8 parallel byte-range segments.
+
+Run: python tests/bench_segmented_download.py [size_mb] [per_connection_mb_per_s]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import RangeHandler, recording_bytes, start_server
+from recording import download_segmented
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rate_mb = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+    server, base_url = start_server(RangeHandler)
+    server.recording = recording_bytes(size_mb * 1024 * 1024)
+    server.drop_rate = 0
+    server.rng = random.Random(0)
+    server.rate = int(rate_mb * 1024 * 1024)
+
+    print("=" * 50)
+    print(f"Segmented download benchmark ({size_mb} MB, {rate_mb:g} MB/s per connection)")
+    print("=" * 50)
+    baseline = None
+    with tempfile.TemporaryDirectory() as workdir:
+        for segments in (1, 2, 4, 8):
+            dest = os.path.join(workdir, f'rec-{segments}.mp3')
+            start = time.perf_counter()
+            download_segmented(f'{base_url}/rec', dest, segments=segments)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{segments} segment(s): {elapsed:6.2f}s  {size_mb / elapsed:6.2f} MB/s  speedup {baseline / elapsed:4.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
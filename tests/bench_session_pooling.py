@@ -0,0 +1,51 @@
+"""
+Session Pooling Benchmark
+Compares one-off requests (new TCP+TLS handshake per call) with the shared
+keep-alive sessions from sessions.py against a local HTTPS stand-in.
+
+Run: python tests/bench_session_pooling.py [calls_per_job]
+"""
+
+import os
+import sys
+import time
+import warnings
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import start_server
+from sessions import PooledSession
+
+warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+
+
+def timed_calls(get, url, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        get(url, verify=False).json()
+    return time.perf_counter() - start
+
+
+def main():
+    # A typical job: token, listing, plus a message and a delete per conference
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    server, base_url = start_server(tls=True)
+    url = f'{base_url}/api/v4/conferences'
+
+    one_off = timed_calls(lambda u, **kw: requests.get(u, timeout=10, **kw), url, calls)
+    session = PooledSession(pool_size=2, timeout=(10, 10))
+    pooled = timed_calls(session.get, url, calls)
+    server.shutdown()
+
+    print("=" * 50)
+    print(f"Session pooling benchmark ({calls} HTTPS calls per job)")
+    print("=" * 50)
+    print(f"One-off requests : {one_off * 1000:8.1f} ms total, {one_off / calls * 1000:6.2f} ms/call")
+    print(f"Pooled session   : {pooled * 1000:8.1f} ms total, {pooled / calls * 1000:6.2f} ms/call")
+    print(f"Handshake savings: {(one_off - pooled) * 1000:8.1f} ms per job ({one_off / pooled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Streaming Transfer Memory Benchmark
+Spools recordings of growing size from a local fake CDN to disk, the way main.py
+does, and streams them back out to a local fake Telegram API, reporting the peak
+RSS of each transfer.
+
+Run: python tests/bench_streaming_memory.py [size_mb ...]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_servers import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import resource, sys
+import telegram_utils
+from recording import download_recording
+from mp3_split import iter_range
+telegram_utils.api_base = sys.argv[1]
+chunk_size = int(sys.argv[3])
+size = download_recording(sys.argv[2], 'bench.mp3', chunk_size)
+assert telegram_utils.send_telegram_file(iter_range('bench.mp3', 0, size, chunk_size), 'bench.mp3', size)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def run_transfer(base_url, size, chunk_size, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD, base_url, f'{base_url}/rec/{size}', str(chunk_size)],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return int(out.stdout.strip().splitlines()[-1])  # KiB on Linux
+
+
+def main():
+    sizes_mb = [int(a) for a in sys.argv[1:]] or [16, 64, 256, 1024]
+    chunk_size = 1024 * 1024
+    server, base_url = start_server()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, '.env'), 'w') as f:
+            f.write('TELEGRAM_BOT_TOKEN=bench\nTELEGRAM_CHAT_ID=1\n')
+
+        print("=" * 50)
+        print(f"Streaming memory benchmark (chunk size {chunk_size // 1024} KiB)")
+        print("=" * 50)
+        results = []
+        for mb in sizes_mb:
+            rss = run_transfer(base_url, mb * 1024 * 1024, chunk_size, workdir)
+            uploaded = server.uploads[-1][1]
+            results.append(rss)
+            print(f"{mb:6d} MB recording -> peak RSS {rss / 1024:7.1f} MB (uploaded {uploaded / 1048576:.1f} MB)")
+
+    server.shutdown()
+    growth = (max(results) - min(results)) / 1024
+    print(f"\nRSS spread across sizes: {growth:.1f} MB")
+    return growth
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Opus Transcoding Benchmark
+Generates speech-like MP3 recordings with ffmpeg, re-encodes them to Opus at a
+few bitrates and reports the bytes saved against the encode time. The
+end-to-end column adds the time to upload the result at the given uplink speed,
+next to uploading the original MP3. A final run encodes several recordings at
+once to show the gain from parallel encoders. Requires ffmpeg with libopus.
+
+Run: python tests/bench_transcode.py [minutes] [mp3_kbps] [uplink_mbit_s] [recordings]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from transcode import Transcoder
+
+
+def make_recording(path, minutes, kbps):
+    # Pink noise with a syllable-rate envelope and pauses: about as compressible as a call
+    source = (f'anoisesrc=color=pink:duration={minutes * 60}:sample_rate=44100,'
+              f"volume='0.6*gt(sin(2*PI*0.2*t),-0.3)*(0.5+0.5*sin(2*PI*4*t))':eval=frame")
+    subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', source,
+                    '-ac', '1', '-c:a', 'libmp3lame', '-b:a', f'{kbps}k', path], check=True)
+
+
+def main():
+    minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    mp3_kbps = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    uplink = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    recordings = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count() or 1
+    bytes_per_s = uplink * 1_000_000 / 8
+
+    print("=" * 70)
+    print(f"Opus transcoding benchmark ({minutes} min call, {mp3_kbps} kbit/s MP3, {uplink:g} Mbit/s uplink)")
+    print("=" * 70)
+    with tempfile.TemporaryDirectory() as workdir:
+        src = os.path.join(workdir, 'call.mp3')
+        make_recording(src, minutes, mp3_kbps)
+        mp3_size = os.path.getsize(src)
+        mp3_upload = mp3_size / bytes_per_s
+        print(f"MP3 as served:  {mp3_size / 1e6:7.2f} MB  upload {mp3_upload:6.1f}s")
+
+        for bitrate in (16000, 24000, 32000):
+            transcoder = Transcoder(bitrate, workers=1)
+            start = time.perf_counter()
+            parts = transcoder.transcode(src, os.path.join(workdir, f'opus-{bitrate}'))
+            encode = time.perf_counter() - start
+            size = sum(os.path.getsize(p) for p in parts)
+            total = encode + size / bytes_per_s
+            print(f"Opus {bitrate // 1000:2d} kbit/s: {size / 1e6:7.2f} MB  saved {1 - size / mp3_size:5.1%}  "
+                  f"encode {encode:5.1f}s  end-to-end {total:6.1f}s vs {mp3_upload:6.1f}s")
+
+        for workers in (1, recordings):
+            transcoder = Transcoder(24000, workers=workers)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=recordings) as pool:
+                list(pool.map(lambda n: transcoder.transcode(src, os.path.join(workdir, f'batch-{workers}-{n}')),
+                              range(recordings)))
+            elapsed = time.perf_counter() - start
+            print(f"{recordings} recordings, {workers} encoder(s): {elapsed:6.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+Local stand-ins for the FCC recording CDN, the Telegram Bot API and an IMAP mailbox
+Used by the benchmarks and tests so they never touch the real services
+"""
+
+import datetime
+import email
+import email.utils
+import hashlib
+import json
+import os
+import re
+import socket
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK = b'\xff\xfb\x90\x64' * 16384  # 64 KiB of MP3-looking filler
+
+
+def read_request_body(handler):
+    """Drain a request body (Content-Length or chunked) and return its size"""
+    total = 0
+    if handler.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        while True:
+            size = int(handler.rfile.readline().strip(), 16)
+            if size == 0:
+                handler.rfile.readline()
+                break
+            while size:
+                n = len(handler.rfile.read(min(size, 65536)))
+                total += n
+                size -= n
+            handler.rfile.readline()
+    else:
+        remaining = int(handler.headers.get('Content-Length', 0))
+        while remaining:
+            n = len(handler.rfile.read(min(remaining, 65536)))
+            total += n
+            remaining -= n
+    return total
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # /rec/<size>.mp3 -> <size> bytes of audio
+        if self.path.startswith('/rec/'):
+            size = int(self.path[len('/rec/'):].split('.')[0])
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            remaining = size
+            while remaining:
+                block = BLOCK[:remaining]
+                self.wfile.write(block)
+                remaining -= len(block)
+        else:
+            self.send_json({'ok': False}, 404)
+
+    def do_POST(self):
+        received = read_request_body(self)
+        self.server.uploads.append((self.path, received))
+        self.send_json({'ok': True, 'result': {'message_id': len(self.server.uploads)}})
+
+
+def recording_bytes(size):
+    """Deterministic, non-repeating recording content of the given size"""
+    out = bytearray()
+    counter = 0
+    while len(out) < size:
+        out += hashlib.sha256(counter.to_bytes(8, 'big')).digest()
+        counter += 1
+    return bytes(out[:size])
+
+
+class RangeHandler(FakeHandler):
+    """Recording server with Range/If-Range support that drops connections.
+
+    server.recording holds the content; with probability server.drop_rate each
+    response is cut off at a random offset, using server.rng for repeatability.
+    server.rate caps each connection at that many bytes per second, and
+    server.ranges = False makes it ignore Range like a plain CDN would.
+    """
+
+    def write_body(self, body):
+        rate = getattr(self.server, 'rate', None)
+        if not rate:
+            self.wfile.write(body)
+            return
+        step = max(1, rate // 50)
+        for i in range(0, len(body), step):
+            self.wfile.write(body[i:i + step])
+            time.sleep(step / rate)
+
+    def do_GET(self):
+        data = self.server.recording
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        start, end, status = 0, len(data) - 1, 200
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and getattr(self.server, 'ranges', True) and (if_range is None or if_range == etag):
+            first, _, last = range_header.split('=')[1].partition('-')
+            start = int(first)
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.server.requests.append((start, status))
+
+        body = data[start:end + 1]
+        self.send_response(status)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        if getattr(self.server, 'ranges', True):
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+
+        if len(body) > 1 and self.server.rng.random() < self.server.drop_rate:
+            self.write_body(body[:self.server.rng.randrange(1, len(body))])
+            self.close_connection = True
+            return
+        self.write_body(body)
+
+
+DEVELOPER_PAGE = """<!DOCTYPE html>
+<html><head><meta name="csrf-token" content="{token}"><title>Free API</title></head>
+<body>
+<form action="/for-developers/free-api/request" method="post">
+  <input type="hidden" name="authenticity_token" value="{token}">
+  <input type="text" name="developer[name]" placeholder="Name">
+  <input type="email" name="developer[email]" placeholder="Email">
+  <input type="tel" name="developer[phone]" placeholder="Phone">
+  <textarea name="developer[purpose]" placeholder="Please explain what you are trying to achieve with this integration"></textarea>
+  <button type="submit">Request Access</button>
+</form>
+</body></html>
+"""
+
+
+class DeveloperPageHandler(FakeHandler):
+    """Mock of the FCC free API page: a CSRF-protected form bound to a session cookie.
+
+    Accepted submissions are appended to server.submissions and answered with
+    JSON {"ok": true}, or with server.reply as (content_type, body) when set.
+    """
+
+    token = 'csrf-7f3a9c'
+
+    def do_GET(self):
+        body = DEVELOPER_PAGE.format(token=self.token).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Set-Cookie', '_fcc_session=abc123; Path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.startswith('/bot'):
+            return FakeHandler.do_POST(self)
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        if '_fcc_session=abc123' not in self.headers.get('Cookie', '') or form.get('authenticity_token') != self.token:
+            return self.send_json({'error': 'invalid csrf'}, 422)
+        self.server.submissions.append(form)
+        reply = getattr(self.server, 'reply', None)
+        if reply is None:
+            return self.send_json({'ok': True})
+        body = reply[1].encode()
+        self.send_response(200)
+        self.send_header('Content-Type', reply[0])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def self_signed_context():
+    """Server-side SSL context with a throwaway self-signed certificate (needs openssl)"""
+    workdir = tempfile.mkdtemp(prefix='fake-tls-')
+    cert, key = os.path.join(workdir, 'cert.pem'), os.path.join(workdir, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', cert],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def start_server(handler=FakeHandler, tls=False):
+    """Start a fake server on a free localhost port, returns (server, base_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.uploads = []
+    server.requests = []
+    server.submissions = []
+    scheme = 'http'
+    if tls:
+        server.socket = self_signed_context().wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://127.0.0.1:{server.server_address[1]}'
+
+
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    """Minimal IMAP4rev1 server: LOGIN, SELECT, (UID) SEARCH, (UID) FETCH and IDLE.
+
+    Messages live in server.messages as (uid, raw_bytes); server.deliver()
+    appends one and wakes IDLE clients. Like real servers, mail that arrives
+    while a client is not idling is announced with an unsolicited EXISTS in the
+    response to its next command; server.report_on_idle = False leaves IDLE
+    itself out of that (so only the client can notice). server.idle = False
+    hides IDLE from CAPABILITY and server.ignore_done = True never ends an
+    IDLE. server.drop_idlers() closes the connections of idling clients.
+    Bytes written are counted in server.bytes_sent.
+    """
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.server.bytes_sent += len(data)
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def capability(self):
+        return 'IMAP4rev1' + (' IDLE' if self.server.idle else '')
+
+    def report_new_mail(self):
+        with self.server.lock:
+            if len(self.server.messages) != self.known:
+                self.known = len(self.server.messages)
+                self.send(f'* {self.known} EXISTS\r\n')
+
+    def handle(self):
+        self.known = 0
+        self.send(f'* OK [CAPABILITY {self.capability()}] fake IMAP ready\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().strip().partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            uid = command == 'UID'
+            if uid:
+                command, _, args = args.partition(' ')
+                command = command.upper()
+            self.server.commands.append(f'{"UID " if uid else ""}{command} {args}'.strip())
+
+            if command == 'CAPABILITY':
+                self.send(f'* CAPABILITY {self.capability()}\r\n')
+            elif command == 'SELECT':
+                self.known = len(self.server.messages)
+                self.send(f'* {self.known} EXISTS\r\n')
+            elif command == 'SEARCH':
+                self.search(args, uid)
+            elif command == 'FETCH':
+                self.fetch(args, uid)
+            elif command == 'IDLE' and self.server.idle:
+                self.send('+ idling\r\n')
+                if self.server.report_on_idle:
+                    self.report_new_mail()
+                with self.server.lock:
+                    self.server.idlers.append(self)
+                if not self.rfile.readline():  # DONE, or the connection was dropped
+                    return
+                if self.server.ignore_done:
+                    self.rfile.readline()
+                    return
+                with self.server.lock:
+                    self.server.idlers.remove(self)
+                self.send(f'{tag} OK IDLE terminated\r\n')
+                continue
+            elif command == 'LOGOUT':
+                self.send('* BYE\r\n')
+                self.send(f'{tag} OK LOGOUT completed\r\n')
+                return
+            elif command not in ('LOGIN', 'CLOSE', 'NOOP'):
+                self.send(f'{tag} BAD unsupported\r\n')
+                continue
+            if command != 'SELECT':
+                self.report_new_mail()
+            self.send(f'{tag} OK {command} completed\r\n')
+
+    def matches(self, raw, criteria):
+        msg = email.message_from_bytes(raw)
+        m = re.search(r'FROM "([^"]+)"', criteria)
+        if m and m.group(1).lower() not in (msg['From'] or '').lower():
+            return False
+        m = re.search(r'SINCE (\S+)', criteria)
+        if m:
+            since = datetime.datetime.strptime(m.group(1).strip('"'), '%d-%b-%Y').date()
+            if email.utils.parsedate_to_datetime(msg['Date']).date() < since:
+                return False
+        return True
+
+    def selected(self, spec, uid):
+        """(seq, uid, raw) for a sequence/UID set like '3', '2:*' or '1,4'"""
+        out = []
+        for seq, (msg_uid, raw) in enumerate(self.server.messages, 1):
+            key = msg_uid if uid else seq
+            for part in spec.split(','):
+                lo, _, hi = part.partition(':')
+                lo = int(lo)
+                hi = lo if not hi else (10 ** 9 if hi == '*' else int(hi))
+                if lo <= key <= hi:
+                    out.append((seq, msg_uid, raw))
+                    break
+        return out
+
+    def search(self, args, uid):
+        m = re.search(r'UID (\S+)', args)
+        candidates = self.selected(m.group(1), True) if m else self.selected('1:*', False)
+        found = [str(u if uid else seq) for seq, u, raw in candidates if self.matches(raw, args)]
+        self.send(f'* SEARCH {" ".join(found)}\r\n'.replace(' \r\n', '\r\n'))
+
+    def fetch(self, args, uid):
+        spec, _, items = args.partition(' ')
+        for seq, msg_uid, raw in self.selected(spec, uid):
+            m = re.search(r'BODY\.PEEK\[HEADER\.FIELDS \(([^)]*)\)\]', items, re.I)
+            if m:
+                wanted = m.group(1).lower().split()
+                header_part = raw.split(b'\r\n\r\n', 1)[0].split(b'\r\n')
+                data = b''.join(h + b'\r\n' for h in header_part
+                                if h.split(b':', 1)[0].decode().lower() in wanted) + b'\r\n'
+                name = f'BODY[HEADER.FIELDS ({m.group(1).upper()})]'
+            else:
+                data = raw
+                name = 'RFC822' if 'RFC822' in items.upper() else 'BODY[]'
+            self.send(f'* {seq} FETCH (UID {msg_uid} {name} {{{len(data)}}}\r\n'.encode() + data + b')\r\n')
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, idle=True):
+        super().__init__(('127.0.0.1', 0), FakeIMAPHandler)
+        self.idle = idle
+        self.report_on_idle = True
+        self.ignore_done = False
+        self.messages = []
+        self.commands = []
+        self.idlers = []
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def deliver(self, raw):
+        with self.lock:
+            uid = self.messages[-1][0] + 1 if self.messages else 1
+            self.messages.append((uid, raw))
+            for handler in self.idlers:
+                handler.known = len(self.messages)
+                handler.send(f'* {len(self.messages)} EXISTS\r\n')
+
+    def drop_idlers(self):
+        """Close the connection of every client in IDLE, as a server restart would"""
+        with self.lock:
+            for handler in self.idlers:
+                handler.connection.shutdown(socket.SHUT_RDWR)
+            self.idlers.clear()
+
+
+def make_email(subject, body, sender='noreply@freeconferencecall.com', date=None):
+    """Raw RFC822 bytes for a simple text email"""
+    date = date or email.utils.formatdate(localtime=True)
+    return (f'From: {sender}\r\nTo: me@example.com\r\nSubject: {subject}\r\nDate: {date}\r\n'
+            f'Content-Type: text/plain\r\n\r\n{body}\r\n').encode()
@@ -0,0 +1,96 @@
+"""
+Tests for serving several FCC accounts from one run
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, start_server
+from file_cache import FileIdCache
+from state import StateIndex
+
+
+class FCCAndTelegramHandler(FakeHandler):
+    """FCC token/listing/delete API and Telegram sendAudio on one port. Each
+    client_id lists one conference; ids in server.revoked are invalid_client"""
+
+    def do_POST(self):
+        if self.path.startswith('/api/v4/token'):
+            length = int(self.headers.get('Content-Length', 0))
+            form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+            if form['client_id'] in self.server.revoked:
+                return self.send_json({'error': 'invalid_client'}, 401)
+            return self.send_json({'access_token': form['client_id'], 'expires_in': 3600})
+        read_request_body(self)
+        if 'sendMessage' in self.path:
+            return self.send_json({'ok': True, 'result': {'message_id': 1}})
+        self.server.uploads.append(self.path)
+        self.send_json({'ok': True, 'result': {'audio': {'file_id': f'file-{len(self.server.uploads)}'}}})
+
+    def do_GET(self):
+        if self.path.startswith('/api/v4/conferences'):
+            client_id = self.headers['Authorization'].split()[-1]
+            self.server.listed.append(client_id)
+            return self.send_json({'conferences': [
+                {'id': client_id, 'start_time': 1700000000, 'recording_url': f'{self.server.url}/rec/50000'}]})
+        super().do_GET()
+
+    def do_DELETE(self):
+        self.server.deleted.append(self.path.rsplit('/', 1)[1])
+        self.send_json({'deleted': True})
+
+
+class StuckRenewer:
+    """A credential renewal that takes until release is set"""
+    release = threading.Event()
+
+    def __init__(self, env_file=None):
+        pass
+
+    def renew_credentials(self):
+        StuckRenewer.release.wait(30)
+        return False
+
+
+def test_account_in_renewal_does_not_hold_up_others(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\nTELEGRAM_COALESCE_SECONDS=0\n')
+    importlib.import_module('config').reload_config()
+    telegram_utils = importlib.import_module('telegram_utils')
+    main = importlib.import_module('main')
+    from accounts import load_accounts
+    from FCC import FCC
+
+    server, base_url = start_server(FCCAndTelegramHandler)
+    server.url, server.revoked, server.listed, server.deleted = base_url, {'stuck-id'}, [], []
+    monkeypatch.setattr(FCC, 'base_url', base_url + '/api/')
+    monkeypatch.setattr(telegram_utils, 'api_base', base_url)
+    monkeypatch.setattr(telegram_utils, 'file_cache', FileIdCache(str(tmp_path / 'file_ids.json')))
+    monkeypatch.setattr(main, 'spool_dir', str(tmp_path / 'spool'))
+    monkeypatch.setattr(importlib.import_module('renew_credentials'), 'FCCCredentialRenewer', StuckRenewer)
+    StuckRenewer.release.clear()
+
+    names = ['stuck', 'ok1', 'ok2']
+    for name in names:
+        (tmp_path / f'{name}.env').write_text(f'client_id={name}-id\nclient_secret=s\nusername={name}\npassword=p\n')
+    accounts = load_accounts(','.join(str(tmp_path / f'{name}.env') for name in names))
+    index = StateIndex(str(tmp_path / 'state.db'))
+
+    start = time.time()
+    main.run_job(accounts, index)
+    # The stuck account's renewal goes on in the background; the others were served meanwhile
+    assert time.time() - start < 15
+    assert accounts[0].fcc.renewing()
+    assert set(server.listed) == {'ok1-id', 'ok2-id'}
+    assert sorted(server.deleted) == ['ok1-id', 'ok2-id']
+    assert len(server.uploads) == 2
+    assert index.get_cursor('conferences:stuck') is None
+    StuckRenewer.release.set()
+    accounts[0].fcc._renewal.join(5)
+    server.shutdown()
@@ -0,0 +1,139 @@
+"""
+Tests for the polling daemon: its schedule, webhook wake-ups and graceful shutdown
+"""
+
+import importlib
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.parse
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, start_server
+from file_cache import FileIdCache
+
+
+class DaemonHandler(FakeHandler):
+    """FCC token/listing/delete API and the Bot API on one port. The listing
+    returns server.conferences; an upload sets server.uploading and is only
+    answered once server.release is set"""
+
+    def do_POST(self):
+        if self.path.startswith('/api/v4/token'):
+            read_request_body(self)
+            return self.send_json({'access_token': 'token', 'expires_in': 3600})
+        read_request_body(self)
+        if 'sendMessage' in self.path:
+            return self.send_json({'ok': True, 'result': {'message_id': 1}})
+        self.server.uploading.set()
+        self.server.release.wait(10)
+        self.server.uploads.append(self.path)
+        self.send_json({'ok': True, 'result': {'audio': {'file_id': f'file-{len(self.server.uploads)}'}}})
+
+    def do_GET(self):
+        if self.path.startswith('/api/v4/conferences'):
+            query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+            before = float(query.get('start_date_to') or 'inf')
+            return self.send_json({'conferences': [c for c in self.server.conferences if c['start_time'] < before]})
+        super().do_GET()
+
+    def do_DELETE(self):
+        self.server.deleted.append(self.path.rsplit('/', 1)[1])
+        self.send_json({'deleted': True})
+
+
+def test_daemon_wakes_on_schedule_and_webhook_and_drains_on_sigterm(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\nTELEGRAM_COALESCE_SECONDS=0\n')
+    importlib.import_module('config').reload_config()
+    telegram_utils = importlib.import_module('telegram_utils')
+    main = importlib.import_module('main')
+    from accounts import load_accounts
+    from FCC import FCC
+
+    server, base_url = start_server(DaemonHandler)
+    server.conferences, server.deleted = [], []
+    server.uploading, server.release = threading.Event(), threading.Event()
+    monkeypatch.setattr(FCC, 'base_url', base_url + '/api/')
+    monkeypatch.setattr(telegram_utils, 'api_base', base_url)
+    monkeypatch.setattr(telegram_utils, 'file_cache', FileIdCache(str(tmp_path / 'file_ids.json')))
+    (tmp_path / 'acct.env').write_text('client_id=id\nclient_secret=s\nusername=u\npassword=p\n')
+    monkeypatch.setattr(main, 'accounts', load_accounts(str(tmp_path / 'acct.env')))
+    monkeypatch.setattr(main, 'state_db', str(tmp_path / 'state.db'))
+    monkeypatch.setattr(main, 'spool_dir', str(tmp_path / 'spool'))
+    monkeypatch.setattr(main, 'poll_interval', 60)
+    monkeypatch.setattr(main, 'poll_jitter', 30)
+    monkeypatch.setattr(main, 'webhook_port', '0')
+
+    # The first wait is jittered down below the one second floor, the second
+    # is a full interval that only the webhook cuts short
+    jitters = [-59.5, 0]
+    uniform_calls = []
+
+    def uniform(a, b):
+        uniform_calls.append((a, b))
+        return jitters.pop(0) if jitters else 0
+    monkeypatch.setattr(main.random, 'uniform', uniform)
+
+    receivers = []
+
+    class Webhook(main.RecordingWebhook):
+        def start(self):
+            receivers.append(self)
+            return super().start()
+    monkeypatch.setattr(main, 'RecordingWebhook', Webhook)
+
+    cycles = []
+    run_job = main.run_job
+
+    def counting_run_job(*args, **kwargs):
+        cycles.append(time.time())
+        return run_job(*args, **kwargs)
+    monkeypatch.setattr(main, 'run_job', counting_run_job)
+
+    def drive():
+        deadline = time.time() + 20
+        while len(cycles) < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        # Let the second cycle finish and start its full-length wait
+        time.sleep(0.5)
+        server.conferences.append({'id': 'c1', 'start_time': int(time.time()),
+                                   'recording_url': f'{base_url}/rec/50000'})
+        requests.post(f'http://127.0.0.1:{receivers[0].port}/recording-ready')
+        if server.uploading.wait(10):
+            os.kill(os.getpid(), signal.SIGTERM)
+            # The upload is still in flight when the shutdown starts
+            time.sleep(0.3)
+        server.release.set()
+        # Make sure a broken daemon cannot hang the test run
+        time.sleep(10)
+        if not stopped.is_set():
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    stopped = threading.Event()
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    threading.Thread(target=drive, daemon=True).start()
+    try:
+        main.run_daemon()
+    finally:
+        stopped.set()
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+        server.release.set()
+
+    assert uniform_calls[0] == (-30, 30)
+    # Jittered below the floor, the second cycle followed after one second
+    assert 0.9 < cycles[1] - cycles[0] < 3
+    # The webhook started the third cycle long before the 60 second poll
+    assert len(cycles) == 3 and cycles[2] - cycles[1] < 10
+    # The upload in flight at SIGTERM finished, then the daemon exited
+    assert len(server.uploads) == 1
+    index = main.StateIndex(str(tmp_path / 'state.db'))
+    assert index.get('c1', f'{base_url}/rec/50000')['uploaded_at']
+    index.close()
+    server.shutdown()
@@ -0,0 +1,73 @@
+"""
+Tests for delivering one recording to several chats
+"""
+
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, start_server
+from file_cache import FileIdCache
+from state import StateIndex
+
+
+class TelegramHandler(FakeHandler):
+    """Recording CDN plus sendAudio; file_id sends answer with server.errors first"""
+
+    def do_POST(self):
+        received = read_request_body(self)
+        if 'sendMessage' in self.path:
+            return self.send_json({'ok': True, 'result': {'message_id': 1}})
+        self.server.uploads.append((self.path, received))
+        if received < 1000 and self.server.errors:
+            status, description = self.server.errors.pop(0)
+            return self.send_json({'ok': False, 'error_code': status, 'description': description,
+                                   'parameters': {'retry_after': 0}}, status)
+        self.send_json({'ok': True, 'result': {'audio': {'file_id': f'file-{len(self.server.uploads)}'}}})
+
+
+class TwoChats:
+    def destinations(self, c):
+        return ['-1', '-2']
+
+
+def deliver(tmp_path, monkeypatch, errors):
+    """Run one recording that chat -1 already has through the pipeline, returns (server, index, c)"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\nTELEGRAM_COALESCE_SECONDS=0\n')
+    importlib.import_module('config').reload_config()
+    telegram_utils = importlib.import_module('telegram_utils')
+    main = importlib.import_module('main')
+    server, base_url = start_server(TelegramHandler)
+    server.errors = list(errors)
+    monkeypatch.setattr(telegram_utils, 'api_base', base_url)
+    monkeypatch.setattr(telegram_utils, 'file_cache', FileIdCache(str(tmp_path / 'file_ids.json')))
+    monkeypatch.setattr(main, 'router', TwoChats())
+    monkeypatch.setattr(main, 'delivery_attempts', 2)
+
+    index = StateIndex(str(tmp_path / 'state.db'))
+    c = {'id': 5, 'recording_url': base_url + '/rec/200000.mp3', 'start_time': 1700000000}
+    index.mark_delivered(c['id'], c['recording_url'], '-1', 'file-A')
+    uploaded = []
+    pipeline = main.make_pipeline(str(tmp_path), index, uploaded.append)
+    pipeline.run([c])
+    server.shutdown()
+    assert uploaded == [c]
+    return server, index, c
+
+
+def test_file_id_send_failure_is_retried_without_upload(tmp_path, monkeypatch):
+    server, index, c = deliver(tmp_path, monkeypatch, [(429, 'Too Many Requests: retry after 0')])
+    # The throttled file_id send is retried as is; the recording is never uploaded again
+    assert [received < 1000 for _, received in server.uploads] == [True, True]
+    assert index.deliveries(c['id'], c['recording_url'])['-2']['file_ids'] == 'file-2'
+
+
+def test_rejected_file_id_falls_back_to_upload(tmp_path, monkeypatch):
+    server, index, c = deliver(tmp_path, monkeypatch,
+                               [(400, 'Bad Request: wrong file identifier/HTTP URL specified')])
+    assert [received < 1000 for _, received in server.uploads] == [True, False]
+    assert server.uploads[1][1] > 200_000
+    assert index.deliveries(c['id'], c['recording_url'])['-2']['file_ids'] == 'file-2'
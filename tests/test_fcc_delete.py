@@ -0,0 +1,74 @@
+"""
+Tests for batched conference deletion against a local FCC API stand-in
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, start_server
+from FCC import FCC
+
+
+class DeleteHandler(FakeHandler):
+    """Token endpoint plus DELETE /api/v4/conferences/<id>; ids in server.flaky
+    fail with a 500 that many times first, ids in server.gone answer 404"""
+
+    def do_POST(self):
+        read_request_body(self)
+        self.send_json({'access_token': 'token', 'expires_in': 3600})
+
+    def do_DELETE(self):
+        id = self.path.rsplit('/', 1)[1]
+        with self.server.lock:
+            self.server.active += 1
+            self.server.peak = max(self.server.peak, self.server.active)
+        time.sleep(0.05)
+        with self.server.lock:
+            self.server.active -= 1
+            self.server.requests.append(id)
+            failures = self.server.flaky.get(id, 0)
+            if failures:
+                self.server.flaky[id] = failures - 1
+        if failures:
+            self.send_json({'error': 'server_error'}, 500)
+        elif id in self.server.gone:
+            self.send_json({'error': 'not_found'}, 404)
+        else:
+            self.send_json({'deleted': True})
+
+
+def fcc_server(flaky=None, gone=()):
+    server, base_url = start_server(DeleteHandler)
+    server.lock = threading.Lock()
+    server.active = server.peak = 0
+    server.flaky = dict(flaky or {})
+    server.gone = set(gone)
+
+    class LocalFCC(FCC):
+        pass
+    LocalFCC.base_url = base_url + '/api/'
+    fcc = LocalFCC('id', 'secret', 'user', 'pw', auto_renew=False, token_cache=None)
+    return server, fcc
+
+
+def test_deletes_concurrently():
+    server, fcc = fcc_server()
+    ids = [str(i) for i in range(8)]
+    deleted, failed = fcc.deleteConferences(ids, workers=4, backoff=0)
+    assert sorted(deleted) == sorted(ids) and failed == {}
+    assert server.peak > 1
+    server.shutdown()
+
+
+def test_retries_failed_ids_only():
+    server, fcc = fcc_server(flaky={'2': 1, '3': 5}, gone={'4'})
+    deleted, failed = fcc.deleteConferences(['1', '2', '3', '4'], attempts=3, backoff=0)
+    # 404 means it is already gone; '3' keeps failing past the last round
+    assert sorted(deleted) == ['1', '2', '4']
+    assert list(failed) == ['3']
+    assert sorted(server.requests) == ['1', '2', '2', '3', '3', '3', '4']
+    server.shutdown()
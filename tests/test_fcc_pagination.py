@@ -0,0 +1,74 @@
+"""
+Tests for listing conferences page by page against a local FCC API stand-in
+"""
+
+import os
+import sys
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, start_server
+from FCC import FCC
+
+
+class ConferencesHandler(FakeHandler):
+    """Token endpoint plus GET /api/v4/conferences over server.conferences,
+    newest first, returning at most server.max_per_page per page"""
+
+    def do_POST(self):
+        read_request_body(self)
+        self.send_json({'access_token': 'token', 'expires_in': 3600})
+
+    def do_GET(self):
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        self.server.requests.append(query)
+        rows = sorted(self.server.conferences, key=lambda c: -c['start_time'])
+        if 'start_date_to' in query:
+            rows = [c for c in rows if c['start_time'] <= int(query['start_date_to'])]
+        if 'start_date_from' in query:
+            rows = [c for c in rows if c['start_time'] >= int(query['start_date_from'])]
+        per_page = min(int(query['per_page']), self.server.max_per_page)
+        self.send_json({'conferences': rows[:per_page]})
+
+
+class IgnoredCursorHandler(ConferencesHandler):
+    """An API that ignores the cursor and answers the same page forever"""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.send_json({'conferences': self.server.conferences[:3]})
+
+
+def fcc_server(count, max_per_page, handler=ConferencesHandler):
+    server, base_url = start_server(handler)
+    server.conferences = [{'id': i, 'start_time': 1000 + i, 'recording_url': f'/rec/{i}.mp3'}
+                          for i in range(count)]
+    server.max_per_page = max_per_page
+
+    class LocalFCC(FCC):
+        pass
+    LocalFCC.base_url = base_url + '/api/'
+    return server, LocalFCC('id', 'secret', 'user', 'pw', auto_renew=False, token_cache=None)
+
+
+def test_lists_every_page_when_api_caps_page_size():
+    server, fcc = fcc_server(23, max_per_page=5)
+    ids = [c['id'] for c in fcc.iter_conferences(page_size=10)]
+    # Every page is shorter than asked for, yet listing goes on until one comes back empty
+    assert ids == list(range(22, -1, -1))
+    server.shutdown()
+
+
+def test_stops_on_page_of_repeats():
+    server, fcc = fcc_server(7, max_per_page=50, handler=IgnoredCursorHandler)
+    assert [c['id'] for c in fcc.iter_conferences(page_size=3)] == [0, 1, 2]
+    assert len(server.requests) == 2
+    server.shutdown()
+
+
+def test_since_is_respected():
+    server, fcc = fcc_server(20, max_per_page=4)
+    ids = [c['id'] for c in fcc.iter_conferences(page_size=4, since=1012)]
+    assert ids == list(range(19, 11, -1))
+    server.shutdown()
@@ -0,0 +1,172 @@
+"""
+Tests for background credential renewal against a local FCC API stand-in
+"""
+
+import fcntl
+import importlib
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+import pytest
+from dotenv import set_key
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, start_server
+from FCC import FCC
+
+
+class TokenHandler(FakeHandler):
+    """Password grants answer a token naming the client_id; GET /api/v4/conferences
+    records the bearer token it was called with and holds while server.hold is clear"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        self.server.grants.append(form['client_id'])
+        if form['client_id'] in self.server.revoked:
+            return self.send_json({'error': 'invalid_client'}, 401)
+        self.send_json({'access_token': f'token-{form["client_id"]}-{len(self.server.grants)}', 'expires_in': 3600})
+
+    def do_GET(self):
+        self.server.in_flight.set()
+        self.server.hold.wait(5)
+        self.server.calls.append(self.headers['Authorization'])
+        self.send_json({'conferences': []})
+
+
+class FakeRenewer:
+    """Stands in for FCCCredentialRenewer: writes the next credentials to the env
+    file once FakeRenewer.release is set, or fails when FakeRenewer.fail is set"""
+    runs = []
+    release = None
+    fail = False
+
+    def __init__(self, env_file=None):
+        self.env_file = env_file
+
+    def renew_credentials(self):
+        FakeRenewer.runs.append(self.env_file)
+        FakeRenewer.release.wait(5)
+        if FakeRenewer.fail:
+            return False
+        set_key(self.env_file, 'client_id', f'id{len(FakeRenewer.runs) + 1}')
+        set_key(self.env_file, 'client_secret', 'secret')
+        set_key(self.env_file, 'credentials_renewed_at', str(int(time.time())))
+        return True
+
+
+@pytest.fixture
+def account(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\n')
+    env_file = str(tmp_path / 'account.env')
+    with open(env_file, 'w') as f:
+        f.write('client_id=id1\nclient_secret=secret\n')
+    importlib.import_module('config').reload_config()
+    monkeypatch.setattr(importlib.import_module('renew_credentials'), 'FCCCredentialRenewer', FakeRenewer)
+    FakeRenewer.runs = []
+    FakeRenewer.release = threading.Event()
+    FakeRenewer.fail = False
+
+    server, base_url = start_server(TokenHandler)
+    server.grants, server.calls, server.revoked = [], [], set()
+    server.in_flight, server.hold = threading.Event(), threading.Event()
+    server.hold.set()
+
+    class LocalFCC(FCC):
+        pass
+    LocalFCC.base_url = base_url + '/api/'
+    fcc = LocalFCC('id1', 'secret', 'user', 'pw', token_cache=None, env_file=env_file)
+    yield server, fcc, env_file
+    FakeRenewer.release.set()
+    server.shutdown()
+
+
+def test_renewal_swaps_client_without_disturbing_calls(account):
+    server, fcc, env_file = account
+    old_token = fcc.access_token
+    server.hold.clear()
+    call = threading.Thread(target=fcc.call, args=('get', 'v4/conferences'))
+    call.start()
+    server.in_flight.wait(5)
+
+    renewal = fcc.start_background_renewal()
+    # Calls in flight or made during the renewal keep the current token
+    server.hold.set()
+    call.join(5)
+    fcc.call('get', 'v4/conferences')
+    assert renewal.is_alive()
+    FakeRenewer.release.set()
+    renewal.join(5)
+    assert server.calls == [f'Bearer {old_token}'] * 2
+    assert fcc.client_id == 'id2'
+
+    # Later token requests use the new client
+    fcc.expires_at = 0
+    fcc.call('get', 'v4/conferences')
+    assert server.grants[-1] == 'id2'
+    assert server.calls[-1].startswith('Bearer token-id2-')
+
+
+def test_failed_renewal_is_retried_after_back_off(account):
+    server, fcc, env_file = account
+    fcc.renewal_retry_interval = 0.5
+    FakeRenewer.fail = True
+    FakeRenewer.release.set()
+    fcc.start_background_renewal().join(5)
+    assert fcc.renewal_error is not None
+
+    # Within the back-off no new attempt starts
+    fcc.start_background_renewal().join(5)
+    assert len(FakeRenewer.runs) == 1
+    time.sleep(0.6)
+    FakeRenewer.fail = False
+    fcc.start_background_renewal().join(5)
+    assert len(FakeRenewer.runs) == 2 and fcc.renewal_error is None
+    assert fcc.client_id == 'id3'
+
+
+def test_waits_for_renewal_in_another_process(account):
+    server, fcc, env_file = account
+    FakeRenewer.release.set()
+    # Another process holds the lock and renews while this one waits
+    with open(env_file + '.renew.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        renewal = fcc.start_background_renewal()
+        time.sleep(0.3)
+        assert renewal.is_alive()
+        set_key(env_file, 'client_id', 'other-id')
+        set_key(env_file, 'credentials_renewed_at', str(int(time.time())))
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    renewal.join(5)
+    # The credentials it wrote are adopted without submitting the form again
+    assert FakeRenewer.runs == []
+    assert fcc.client_id == 'other-id'
+
+
+def test_renews_again_on_one_instance(account):
+    server, fcc, env_file = account
+    FakeRenewer.release.set()
+    fcc.start_background_renewal().join(5)
+    assert fcc.client_id == 'id2'
+    # Fresh credentials are not renewed again
+    fcc.check_credentials_age()
+    fcc._renewal.join(5)
+    assert len(FakeRenewer.runs) == 1
+
+    # A long-running process sees the renewed credentials near expiry too
+    fcc.credentials_issued_at = time.time() - fcc.credential_lifetime
+    fcc.check_credentials_age()
+    fcc._renewal.join(5)
+    assert len(FakeRenewer.runs) == 2 and fcc.client_id == 'id3'
+
+    # And renews when the server rejects them, however fresh they are
+    server.revoked.add('id3')
+    fcc.access_token, fcc.expires_at = None, 0
+    fcc.call('get', 'v4/conferences')
+    assert len(FakeRenewer.runs) == 3 and fcc.client_id == 'id4'
+    assert server.calls[-1].startswith('Bearer token-id4-')
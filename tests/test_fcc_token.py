@@ -0,0 +1,117 @@
+"""
+Tests for access token caching, refreshing and retrying against a local FCC API stand-in
+"""
+
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, start_server
+from FCC import FCC
+
+
+class TokenHandler(FakeHandler):
+    """Password and refresh_token grants, recorded in server.grants; every token
+    issued is numbered. GET /api/v4/conferences records its bearer token and
+    answers 401 for tokens in server.rejected"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode()))
+        self.server.grants.append(form['grant_type'])
+        if form['grant_type'] == 'refresh_token' and form['refresh_token'] not in self.server.refresh_tokens:
+            return self.send_json({'error': 'invalid_grant'}, 400)
+        n = len(self.server.grants)
+        self.server.refresh_tokens.add(f'refresh-{n}')
+        self.send_json({'access_token': f'access-{n}', 'refresh_token': f'refresh-{n}', 'expires_in': 3600})
+
+    def do_GET(self):
+        token = self.headers['Authorization'][len('Bearer '):]
+        self.server.calls.append(token)
+        if token in self.server.rejected:
+            return self.send_json({'error': 'invalid_token'}, 401)
+        self.send_json({'conferences': []})
+
+
+@pytest.fixture
+def api(tmp_path):
+    server, base_url = start_server(TokenHandler)
+    server.grants, server.calls = [], []
+    server.refresh_tokens, server.rejected = set(), set()
+
+    class LocalFCC(FCC):
+        pass
+    LocalFCC.base_url = base_url + '/api/'
+    cache = str(tmp_path / '.fcc_token.json')
+
+    def make(client_id='id'):
+        return LocalFCC(client_id, 'secret', 'user', 'pw', auto_renew=False, token_cache=cache)
+    yield server, make, cache
+    server.shutdown()
+
+
+def test_reuses_cached_token_across_instances(api):
+    server, make, cache = api
+    make().call('get', 'v4/conferences')
+    assert server.grants == ['password']
+
+    # A second process with the same credentials starts without a token request
+    fcc = make()
+    fcc.call('get', 'v4/conferences')
+    assert server.grants == ['password']
+    assert server.calls == ['access-1', 'access-1']
+
+    # Renewed credentials don't pick up the old client's token
+    make('other-id')
+    assert server.grants == ['password', 'password']
+
+
+def test_refreshes_with_refresh_token(api):
+    server, make, cache = api
+    fcc = make()
+    fcc.expires_at = time.time()
+    fcc.call('get', 'v4/conferences')
+    assert server.grants == ['password', 'refresh_token']
+    assert server.calls == ['access-2']
+    with open(cache) as f:
+        assert json.load(f)['refresh_token'] == 'refresh-2'
+
+    # A cached token close to expiry is refreshed on start-up
+    with open(cache) as f:
+        cached = json.load(f)
+    cached['expires_at'] = time.time() + 10
+    with open(cache, 'w') as f:
+        json.dump(cached, f)
+    assert make().access_token == 'access-3'
+    assert server.grants == ['password', 'refresh_token', 'refresh_token']
+
+
+def test_falls_back_to_password_grant_when_refresh_fails(api):
+    server, make, cache = api
+    fcc = make()
+    server.refresh_tokens.clear()
+    fcc.expires_at = time.time()
+    fcc.call('get', 'v4/conferences')
+    assert server.grants == ['password', 'refresh_token', 'password']
+    assert server.calls == ['access-3']
+
+
+def test_rejected_token_is_refreshed_once_and_retried(api):
+    server, make, cache = api
+    fcc = make()
+    server.rejected.add('access-1')
+    assert fcc.call('get', 'v4/conferences') == {'conferences': []}
+    assert server.grants == ['password', 'refresh_token']
+    assert server.calls == ['access-1', 'access-2']
+
+    # A token rejected again after the refresh is not retried in a loop
+    server.rejected.update({'access-2', 'access-3'})
+    assert fcc._request('get', 'v4/conferences').status_code == 401
+    assert server.grants == ['password', 'refresh_token', 'refresh_token']
+    assert server.calls == ['access-1', 'access-2', 'access-2', 'access-3']
@@ -0,0 +1,118 @@
+"""
+Tests for the content-addressed Telegram file_id cache
+"""
+
+import hashlib
+import importlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, recording_bytes, start_server
+from file_cache import FileIdCache, file_digest
+
+
+def test_digest_of_range(tmp_path):
+    data = recording_bytes(100_000)
+    path = str(tmp_path / 'rec.mp3')
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert file_digest(path, chunk_size=4096) == hashlib.sha256(data).hexdigest()
+    assert file_digest(path, 1000, 60_000, chunk_size=4096) == hashlib.sha256(data[1000:60_000]).hexdigest()
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    path = str(tmp_path / 'file_ids.json')
+    cache = FileIdCache(path, max_entries=2)
+    cache.put('a', 'id-a')
+    cache.put('b', 'id-b')
+    assert cache.get('a') == 'id-a'
+    cache.put('c', 'id-c')
+    # 'b' was the least recently used
+    assert cache.get('b') is None
+
+    cache = FileIdCache(path, max_entries=2)
+    assert cache.get('a') == 'id-a' and cache.get('c') == 'id-c'
+    cache.discard('a')
+    assert FileIdCache(path).get('a') is None
+
+
+def test_ttl(tmp_path):
+    cache = FileIdCache(str(tmp_path / 'file_ids.json'), ttl=0.2)
+    cache.put('a', 'id-a')
+    assert cache.get('a') == 'id-a'
+    time.sleep(0.3)
+    assert cache.get('a') is None
+    assert len(FileIdCache(str(tmp_path / 'file_ids.json'), ttl=0.2)) == 0
+
+
+class AudioHandler(FakeHandler):
+    """sendAudio that answers with a file_id derived from the uploaded size"""
+
+    def do_POST(self):
+        received = read_request_body(self)
+        self.server.uploads.append((self.path, received))
+        self.send_json({'ok': True, 'result': {'audio': {'file_id': f'file-{len(self.server.uploads)}'}}})
+
+
+def test_resend_uses_file_id(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\nTELEGRAM_COALESCE_SECONDS=0\n')
+    importlib.import_module('config').reload_config()
+    telegram_utils = importlib.import_module('telegram_utils')
+    server, base_url = start_server(AudioHandler)
+    monkeypatch.setattr(telegram_utils, 'api_base', base_url)
+    monkeypatch.setattr(telegram_utils, 'file_cache', FileIdCache(str(tmp_path / 'file_ids.json')))
+
+    data = recording_bytes(2_000_000)
+    digest = hashlib.sha256(data).hexdigest()
+    chunks = [data[i:i + 65536] for i in range(0, len(data), 65536)]
+    assert telegram_utils.send_telegram_file(iter(chunks), 'a.mp3', len(data)) == 'file-1'
+    # The digest was computed while streaming, so the second send is a reference
+    assert telegram_utils.send_telegram_file(iter(chunks), 'b.mp3', len(data), digest)
+    assert server.uploads[0][1] > len(data)
+    assert server.uploads[1][1] < 1000
+    server.shutdown()
+
+
+class FlakyAudioHandler(AudioHandler):
+    """AudioHandler whose file_id sends answer with queued errors first"""
+
+    def do_POST(self):
+        received = read_request_body(self)
+        self.server.uploads.append((self.path, received))
+        if received < 1000 and self.server.errors:
+            status, description = self.server.errors.pop(0)
+            return self.send_json({'ok': False, 'error_code': status, 'description': description,
+                                   'parameters': {'retry_after': 0}}, status)
+        self.send_json({'ok': True, 'result': {'audio': {'file_id': f'file-{len(self.server.uploads)}'}}})
+
+
+def test_cache_kept_unless_file_id_rejected(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\nTELEGRAM_COALESCE_SECONDS=0\n'
+                                   'TELEGRAM_CHAT_RATE=100\n')
+    importlib.import_module('config').reload_config()
+    telegram_utils = importlib.import_module('telegram_utils')
+    server, base_url = start_server(FlakyAudioHandler)
+    server.errors = [(429, 'Too Many Requests: retry after 0'), (400, 'Bad Request: chat not found'),
+                     (400, 'Bad Request: wrong file identifier/HTTP URL specified')]
+    monkeypatch.setattr(telegram_utils, 'api_base', base_url)
+    cache = FileIdCache(str(tmp_path / 'file_ids.json'))
+    monkeypatch.setattr(telegram_utils, 'file_cache', cache)
+
+    data = recording_bytes(200_000)
+    # A passed digest is trusted, not recomputed from the stream
+    cache.put('d1', 'stale-id')
+    # Throttling and a bad chat fail the send but keep the entry, without uploading
+    assert telegram_utils.send_telegram_file(data, 'a.mp3', digest='d1') is False
+    assert telegram_utils.send_telegram_file(data, 'a.mp3', digest='d1') is False
+    assert cache.get('d1') == 'stale-id'
+    assert all(received < 1000 for _, received in server.uploads)
+    # Only a rejected file_id drops it and uploads again, cached under the given digest
+    assert telegram_utils.send_telegram_file(data, 'a.mp3', digest='d1') == 'file-4'
+    assert server.uploads[-1][1] > len(data)
+    assert cache.get('d1') == 'file-4'
+    server.shutdown()
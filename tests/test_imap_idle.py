@@ -0,0 +1,166 @@
+"""
+Tests for waiting on the credentials email against a local IMAP stand-in
+"""
+
+import imaplib
+import importlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.dirname(TESTS))
+from fake_servers import FakeIMAPServer, make_email
+
+CREDENTIALS_EMAIL = make_email(
+    'Your FCC API credentials',
+    'Public API key: 99e78c7d09c8ca55\nPrivate API key: 4393e0302abdb06cd5d0cb932fbb4d83714f1bf2'
+)
+
+
+@pytest.fixture
+def renewer_for(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def make(server):
+        with open(tmp_path / '.env', 'w') as f:
+            f.write('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\n'
+                    'TELEGRAM_COALESCE_SECONDS=0\nusername=me@example.com\npassword=secret\n'
+                    f'IMAP_SERVER=127.0.0.1\nIMAP_PORT={server.port}\nIMAP_SSL=false\n')
+        # Settings are cached per process; an earlier test may have loaded them elsewhere
+        importlib.import_module('config').reload_config()
+        renew_credentials = importlib.import_module('renew_credentials')
+        # The progress messages would otherwise go to the real Bot API
+        monkeypatch.setattr(renew_credentials, 'send_telegram_message', lambda *a, **k: True)
+        return renew_credentials.FCCCredentialRenewer()
+    return make
+
+
+def deliver_later(server, raw, delay):
+    timer = threading.Timer(delay, server.deliver, args=(raw,))
+    timer.start()
+    return timer
+
+
+def test_idle_wakes_up_when_email_arrives(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    renewer = renewer_for(server)
+    deliver_later(server, CREDENTIALS_EMAIL, 0.5)
+
+    start = time.time()
+    credentials = renewer.check_email_for_credentials(max_wait_minutes=1, poll_interval=30)
+    assert credentials == {'client_id': '99e78c7d09c8ca55',
+                           'client_secret': '4393e0302abdb06cd5d0cb932fbb4d83714f1bf2'}
+    assert time.time() - start < 5
+    assert any(c.startswith('IDLE') for c in server.commands)
+    server.shutdown()
+
+
+def test_polls_when_server_lacks_idle(renewer_for):
+    server = FakeIMAPServer(idle=False)
+    renewer = renewer_for(server)
+    deliver_later(server, CREDENTIALS_EMAIL, 0.3)
+
+    credentials = renewer.check_email_for_credentials(max_wait_minutes=1, poll_interval=0.2)
+    assert credentials['client_id'] == '99e78c7d09c8ca55'
+    assert not any(c.startswith('IDLE') for c in server.commands)
+    server.shutdown()
+
+
+def test_gives_up_after_max_wait(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    renewer = renewer_for(server)
+    start = time.time()
+    assert renewer.check_email_for_credentials(max_wait_minutes=0.01) is None
+    assert time.time() - start < 3
+    server.shutdown()
+
+
+def test_scan_fetches_headers_before_bodies(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    # Years of old FCC mail with large bodies, plus recent unrelated FCC mail
+    for i in range(200):
+        server.deliver(make_email('Your FCC API credentials', 'x' * 50_000, date='Mon, 01 Jan 2024 10:00:00 +0000'))
+    for i in range(3):
+        server.deliver(make_email('Meeting summary', 'y' * 50_000))
+    renewer = renewer_for(server)
+    deliver_later(server, CREDENTIALS_EMAIL, 0.3)
+
+    credentials = renewer.check_email_for_credentials(max_wait_minutes=1)
+    assert credentials['client_id'] == '99e78c7d09c8ca55'
+    # Only the credentials email body was downloaded, everything else was headers
+    assert server.bytes_sent < 5_000
+    assert any(c.startswith('UID SEARCH UID ') for c in server.commands)
+    server.shutdown()
+
+
+def test_idle_sees_mail_announced_before_it(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    # Only the response to a regular command announces the new mail, not IDLE
+    server.report_on_idle = False
+    renewer = renewer_for(server)
+    mail = renewer._connect_mailbox()
+    server.deliver(CREDENTIALS_EMAIL)
+    mail.noop()
+
+    start = time.time()
+    assert renewer._idle(mail, 5) is True
+    assert time.time() - start < 1
+    assert not any(c.startswith('IDLE') for c in server.commands)
+    # The buffered notice was consumed, so the next IDLE waits for new mail again
+    assert renewer._idle(mail, 0.3) is False
+    mail.logout()
+    server.shutdown()
+
+
+def test_idle_drops_connection_when_server_never_ends_it(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    server.ignore_done = True
+    renewer = renewer_for(server)
+    mail = renewer._connect_mailbox()
+
+    with pytest.raises(imaplib.IMAP4.abort):
+        renewer._idle(mail, 0.2, done_timeout=0.5)
+    # The connection is closed, so no reader is left consuming it
+    assert mail.sock.fileno() == -1
+    server.shutdown()
+
+
+def drop_when_idling(server):
+    def drop():
+        while not server.idlers:
+            time.sleep(0.01)
+        server.drop_idlers()
+    threading.Thread(target=drop, daemon=True).start()
+
+
+def test_idle_raises_when_connection_drops(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    renewer = renewer_for(server)
+    mail = renewer._connect_mailbox()
+    drop_when_idling(server)
+
+    start = time.time()
+    with pytest.raises(imaplib.IMAP4.abort):
+        renewer._idle(mail, 5)
+    assert time.time() - start < 1
+    server.shutdown()
+
+
+def test_reconnects_after_connection_drops_during_idle(renewer_for):
+    server = FakeIMAPServer(idle=True)
+    renewer = renewer_for(server)
+    drop_when_idling(server)
+    # Delivered after the drop, so it can only be found on the new connection
+    deliver_later(server, CREDENTIALS_EMAIL, 0.3)
+
+    start = time.time()
+    credentials = renewer.check_email_for_credentials(max_wait_minutes=1, poll_interval=30)
+    assert credentials['client_id'] == '99e78c7d09c8ca55'
+    assert time.time() - start < 5
+    assert sum(c.startswith('LOGIN') for c in server.commands) == 2
+    server.shutdown()
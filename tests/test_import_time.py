@@ -0,0 +1,78 @@
+"""
+Cold-start regression tests: import cost of the entry points and config loading
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENV = ('client_id=id\nclient_secret=secret\nusername=me@example.com\npassword=pw\n'
+       'TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\n')
+
+# Cumulative import time allowed for main, in microseconds. Most of it is requests;
+# loading Selenium as well used to add well over 50 ms.
+BUDGET_US = 750000
+
+
+def import_times(module, workdir):
+    """Run `python -X importtime -c "import module"` and return {module: cumulative us}"""
+    with open(os.path.join(workdir, '.env'), 'w') as f:
+        f.write(ENV)
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=workdir, env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_main_cold_start(tmp_path):
+    times = import_times('main', str(tmp_path))
+    assert not [m for m in times if m.startswith('selenium')]
+    assert not [m for m in times if m.startswith('renew_credentials')]
+    assert times['main'] < BUDGET_US, f"import main took {times['main'] / 1000:.0f} ms"
+
+
+def test_renewer_imports_selenium_lazily(tmp_path):
+    times = import_times('renew_credentials', str(tmp_path))
+    assert 'renew_credentials' in times
+    assert not [m for m in times if m.startswith('selenium')]
+
+
+def test_config_is_loaded_once(tmp_path, monkeypatch):
+    import config
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('A=1\n')
+    monkeypatch.setattr(config, '_config', {})
+    monkeypatch.setattr(config, '_loaded', False)
+
+    settings = config.get_config()
+    assert settings == {'A': '1'}
+    (tmp_path / '.env').write_text('A=2\n')
+    assert config.get_config()['A'] == '1'
+    # Reloading updates the same dict that modules already hold
+    assert config.reload_config() is settings
+    assert settings['A'] == '2'
+
+
+def test_reload_updates_in_place(tmp_path, monkeypatch):
+    import config
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('A=1\nB=2\n')
+    monkeypatch.setattr(config, '_config', {})
+    monkeypatch.setattr(config, '_loaded', False)
+
+    settings = config.get_config()
+    (tmp_path / '.env').write_text('A=3\nC=4\n')
+    assert config.reload_config() is settings
+    # Changed keys are overwritten, stale ones dropped, new ones added
+    assert settings == {'A': '3', 'C': '4'}
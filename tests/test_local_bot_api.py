@@ -0,0 +1,86 @@
+"""
+Tests for uploading by file path to a local Bot API server (TELEGRAM_UPLOAD_MODE=local)
+"""
+
+import hashlib
+import importlib
+import os
+import sys
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import FakeHandler, read_request_body, recording_bytes, start_server
+from file_cache import FileIdCache
+from state import StateIndex
+
+
+class LocalBotAPIHandler(FakeHandler):
+    """Recording CDN plus sendAudio. Form-encoded sends are recorded in
+    server.paths as their parsed fields, multipart uploads in server.uploads
+    as their size"""
+
+    def do_POST(self):
+        if 'sendMessage' in self.path:
+            read_request_body(self)
+            return self.send_json({'ok': True, 'result': {'message_id': 1}})
+        if self.headers.get('Content-Type') == 'application/x-www-form-urlencoded':
+            length = int(self.headers.get('Content-Length', 0))
+            self.server.paths.append(dict(urllib.parse.parse_qsl(self.rfile.read(length).decode())))
+        else:
+            self.server.uploads.append(read_request_body(self))
+        n = len(self.server.paths) + len(self.server.uploads)
+        self.send_json({'ok': True, 'result': {'audio': {'file_id': f'file-{n}'}}})
+
+
+def local_bot_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\nTELEGRAM_COALESCE_SECONDS=0\n')
+    importlib.import_module('config').reload_config()
+    telegram_utils = importlib.import_module('telegram_utils')
+    server, base_url = start_server(LocalBotAPIHandler)
+    server.paths = []
+    monkeypatch.setattr(telegram_utils, 'api_base', base_url)
+    monkeypatch.setattr(telegram_utils, 'file_cache', FileIdCache(str(tmp_path / 'file_ids.json')))
+    return server, base_url, telegram_utils
+
+
+def test_sends_path_instead_of_bytes(tmp_path, monkeypatch):
+    server, base_url, telegram_utils = local_bot_api(tmp_path, monkeypatch)
+    data = recording_bytes(300_000)
+    (tmp_path / 'rec.mp3').write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+
+    assert telegram_utils.send_telegram_file_path('rec.mp3', 'rec.mp3', digest) == 'file-1'
+    assert server.uploads == []
+    assert server.paths[0]['audio'] == 'file://' + str(tmp_path / 'rec.mp3')
+    assert server.paths[0]['title'] == 'rec'
+    # The file_id is cached like an upload's, so a re-send goes by reference
+    assert telegram_utils.send_telegram_file_path('rec.mp3', 'again.mp3', digest)
+    assert server.paths[1]['audio'] == 'file-1'
+    server.shutdown()
+
+
+def test_pipeline_uploads_parts_as_bytes(tmp_path, monkeypatch):
+    server, base_url, telegram_utils = local_bot_api(tmp_path, monkeypatch)
+    main = importlib.import_module('main')
+    monkeypatch.setattr(main, 'upload_mode', 'local')
+    index = StateIndex(str(tmp_path / 'state.db'))
+
+    whole = {'id': 1, 'recording_url': base_url + '/rec/200000.mp3', 'start_time': 1700000000}
+    split = {'id': 2, 'recording_url': base_url + '/rec/300000.mp3', 'start_time': 1700000000}
+    uploaded = []
+    pipeline = main.make_pipeline(str(tmp_path), index, uploaded.append)
+    pipeline.run([whole])
+    # A recording over the upload limit is split; a part is a byte range of
+    # the spooled file, which the server can't read by path, so it is uploaded
+    monkeypatch.setattr(main, 'max_upload', 250_000)
+    pipeline = main.make_pipeline(str(tmp_path), index, uploaded.append)
+    pipeline.run([split])
+    server.shutdown()
+
+    assert uploaded == [whole, split]
+    assert [p['audio'] for p in server.paths] == ['file://' + str(tmp_path / '1.mp3')]
+    # Both parts went out as multipart bodies, together the whole recording
+    assert len(server.uploads) == 2 and sum(server.uploads) > 300_000
+    assert index.deliveries(2, split['recording_url'])['1']['file_ids'] == 'file-2,file-3'
@@ -0,0 +1,59 @@
+"""
+Tests for the run metrics exports
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import Histogram, Metrics
+
+
+def test_quantiles_follow_recent_values():
+    h = Histogram(max_samples=100)
+    for _ in range(1000):
+        h.observe(0.01)
+    for _ in range(100):
+        h.observe(5.0)
+    # The window holds only the slow tail now; counts still cover everything
+    assert h.quantile(0.5) == 5.0
+    assert h.count == 1100 and h.counts[0] == 1000
+
+
+def test_prometheus_text():
+    m = Metrics(prefix='t')
+    m.observe('stage_seconds', 0.2, stage='download')
+    m.observe('stage_seconds', 3, stage='download')
+    m.count('bytes_total', 100, direction='upload')
+    m.count('bytes_total', 50, direction='upload')
+    m.gauge('queue_depth', 4, queue='messages')
+    lines = m.prometheus().splitlines()
+
+    assert lines.count('# TYPE t_stage_seconds histogram') == 1
+    assert 't_stage_seconds_bucket{stage="download",le="0.1"} 0' in lines
+    assert 't_stage_seconds_bucket{stage="download",le="0.25"} 1' in lines
+    assert 't_stage_seconds_bucket{stage="download",le="5"} 2' in lines
+    assert 't_stage_seconds_bucket{stage="download",le="+Inf"} 2' in lines
+    assert 't_stage_seconds_sum{stage="download"} 3.2' in lines
+    assert 't_stage_seconds_count{stage="download"} 2' in lines
+    assert '# TYPE t_bytes_total counter' in lines
+    assert 't_bytes_total{direction="upload"} 150' in lines
+    assert 't_queue_depth{queue="messages"} 4' in lines
+    assert any(line.startswith('t_last_run_timestamp_seconds ') for line in lines)
+
+
+def test_json_report(tmp_path):
+    m = Metrics()
+    for seconds in (1, 2, 3, 4):
+        m.observe('stage_seconds', seconds, stage='upload')
+    m.count('bytes_total', 1024 * 1024, direction='download')
+    path = str(tmp_path / 'report.json')
+    m.write_json(path)
+    with open(path) as f:
+        report = json.load(f)
+
+    stage = report['stages']['stage=upload']
+    assert stage == {'count': 4, 'total_seconds': 10, 'max_seconds': 4, 'p50_seconds': 3, 'p95_seconds': 4}
+    assert report['counters'] == {'bytes_total{direction="download"}': 1024 * 1024}
+    assert report['throughput_mb_per_second']['download'] > 0
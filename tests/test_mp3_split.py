@@ -0,0 +1,55 @@
+"""
+Tests for frame-aligned MP3 splitting
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mp3_split import frame_length, split_points, iter_range
+
+# MPEG1 Layer III, 128 kbps, 44.1 kHz, no padding -> 417 byte frames
+HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+# Same with the padding bit set -> 418 byte frames
+PADDED = bytes([0xFF, 0xFB, 0x92, 0x00])
+
+
+def make_mp3(path, frames):
+    id3 = b'ID3\x04\x00\x00' + bytes([0, 0, 0x01, 0x00]) + b'\x00' * 128
+    body = b''
+    for i in range(frames):
+        header = PADDED if i % 3 == 0 else HEADER
+        body += header + bytes([i % 256]) * (frame_length(header) - 4)
+    data = id3 + body + b'TAG' + b'\x00' * 125
+    with open(path, 'wb') as f:
+        f.write(data)
+    return data
+
+
+def test_frame_length():
+    assert frame_length(HEADER) == 417
+    assert frame_length(PADDED) == 418
+    assert frame_length(b'\x00\x00\x00\x00') is None
+
+
+def test_split_on_frame_boundaries(tmp_path):
+    path = str(tmp_path / 'rec.mp3')
+    data = make_mp3(path, 1000)
+    ranges = split_points(path, 50_000)
+
+    assert len(ranges) >= -(-len(data) // 50_000)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    joined = b''
+    for start, end in ranges:
+        part = b''.join(iter_range(path, start, end, chunk_size=4096))
+        assert len(part) <= 50_000
+        if start:
+            assert frame_length(part[:4]) is not None
+        joined += part
+    assert joined == data
+
+
+def test_small_file_is_one_part(tmp_path):
+    path = str(tmp_path / 'rec.mp3')
+    data = make_mp3(path, 10)
+    assert split_points(path, 1_000_000) == [(0, len(data))]
@@ -0,0 +1,105 @@
+"""
+Tests for the download/upload pipeline ordering guarantees
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import TransferPipeline
+
+
+def test_finish_runs_only_after_successful_upload():
+    events = []
+    lock = threading.Lock()
+
+    def download(i):
+        time.sleep(0.01)
+        return f'file-{i}', 100
+
+    def upload(i, path):
+        if i == 3:
+            raise Exception('upload failed')
+        with lock:
+            events.append(('upload', i))
+        return 100
+
+    def finish(i):
+        with lock:
+            events.append(('delete', i))
+
+    errors = []
+    pipeline = TransferPipeline(download, upload, finish, lambda stage, i, e: errors.append((stage, i)),
+                                download_workers=3, upload_workers=2)
+    stats = pipeline.run(range(8))
+
+    deleted = [i for kind, i in events if kind == 'delete']
+    assert sorted(deleted) == [0, 1, 2, 4, 5, 6, 7]
+    for i in deleted:
+        assert events.index(('upload', i)) < events.index(('delete', i))
+    assert errors == [('upload', 3)]
+    assert stats['download'].items == 8
+    assert stats['upload'].items == 7 and stats['upload'].failures == 1
+    assert stats['upload'].bytes == 700
+
+
+def test_pending_queue_is_bounded():
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def download(i):
+        with lock:
+            in_flight.append(i)
+            peak[0] = max(peak[0], len(in_flight))
+        return i, 1
+
+    def upload(i, result):
+        time.sleep(0.005)
+        with lock:
+            in_flight.remove(i)
+        return 1
+
+    TransferPipeline(download, upload, download_workers=4, upload_workers=1, max_pending=2).run(range(20))
+    # pending queue + one item per downloader + the one being uploaded
+    assert peak[0] <= 2 + 4 + 1
+
+
+def test_process_stage_has_its_own_workers():
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+    downloaded = []
+
+    def download(i):
+        downloaded.append(time.monotonic())
+        return i, 1
+
+    def process(i, result):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.1)
+        with lock:
+            active[0] -= 1
+        if i == 5:
+            raise Exception('encode failed')
+        return result * 10
+
+    uploaded = []
+    errors = []
+    pipeline = TransferPipeline(download, lambda i, r: uploaded.append(r) or 1,
+                                on_error=lambda stage, i, e: errors.append((stage, i)),
+                                download_workers=1, upload_workers=1, max_pending=8,
+                                process=process, process_workers=3)
+    stats = pipeline.run(range(6))
+
+    # Three encodes ran at once though there is only one download worker
+    assert peak[0] == 3
+    assert sorted(uploaded) == [0, 10, 20, 30, 40]
+    assert errors == [('process', 5)]
+    assert stats['process'].items == 5 and stats['process'].failures == 1
+    # Downloads were not held up by the encodes behind them
+    assert downloaded[-1] - downloaded[0] < 0.1
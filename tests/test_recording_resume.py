@@ -0,0 +1,87 @@
+"""
+Tests for resumable recording downloads against a server that drops connections
+"""
+
+import hashlib
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_servers import RangeHandler, recording_bytes, start_server
+import recording
+
+
+def flaky_server(size, drop_rate, seed):
+    server, base_url = start_server(RangeHandler)
+    server.recording = recording_bytes(size)
+    server.drop_rate = drop_rate
+    server.rng = random.Random(seed)
+    return server, base_url
+
+
+def test_resumes_after_random_disconnects(tmp_path):
+    for seed in range(5):
+        server, base_url = flaky_server(300_000, 0.7, seed)
+        dest = str(tmp_path / f'rec-{seed}.mp3')
+        size = recording.download_recording(f'{base_url}/rec', dest, chunk_size=4096, max_retries=50, backoff=0)
+        with open(dest, 'rb') as f:
+            assert hashlib.sha256(f.read()).digest() == hashlib.sha256(server.recording).digest()
+        assert size == len(server.recording)
+        assert not os.path.exists(dest + '.part')
+        # Every retry after the first request continued from where it stopped
+        assert all(status == 206 for start, status in server.requests[1:])
+        server.shutdown()
+
+
+def test_resumes_partial_file_from_previous_run(tmp_path):
+    server, base_url = flaky_server(50_000, 0, 0)
+    dest = str(tmp_path / 'rec.mp3')
+    with open(dest + '.part', 'wb') as f:
+        f.write(server.recording[:20_000])
+
+    recording.download_recording(f'{base_url}/rec', dest, backoff=0)
+    assert server.requests == [(20_000, 206)]
+    with open(dest, 'rb') as f:
+        assert f.read() == server.recording
+    server.shutdown()
+
+
+def test_changed_recording_restarts_from_zero(tmp_path):
+    server, base_url = flaky_server(50_000, 0, 0)
+    dest = str(tmp_path / 'rec.mp3')
+    with open(dest + '.part', 'wb') as f:
+        f.write(b'x' * 20_000)
+    with open(dest + '.part.etag', 'w') as f:
+        f.write('"stale"')
+
+    recording.download_recording(f'{base_url}/rec', dest, backoff=0)
+    assert server.requests == [(0, 200)]
+    with open(dest, 'rb') as f:
+        assert f.read() == server.recording
+    server.shutdown()
+
+
+def test_segmented_download_survives_disconnects(tmp_path):
+    server, base_url = flaky_server(200_003, 0.3, 1)
+    dest = str(tmp_path / 'rec.mp3')
+    size = recording.download_segmented(f'{base_url}/rec', dest, segments=4, chunk_size=4096,
+                                        max_retries=50, backoff=0)
+    assert size == len(server.recording)
+    with open(dest, 'rb') as f:
+        assert f.read() == server.recording
+    starts = {start for start, status in server.requests if status == 206}
+    assert {0, 50_001, 100_002, 150_003} <= starts
+    server.shutdown()
+
+
+def test_segmented_download_falls_back_without_ranges(tmp_path):
+    server, base_url = flaky_server(30_000, 0, 0)
+    server.ranges = False
+    dest = str(tmp_path / 'rec.mp3')
+    recording.download_segmented(f'{base_url}/rec', dest, segments=4, backoff=0)
+    with open(dest, 'rb') as f:
+        assert f.read() == server.recording
+    assert [status for start, status in server.requests] == [200, 200]
+    server.shutdown()
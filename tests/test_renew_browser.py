@@ -0,0 +1,74 @@
+"""
+Tests for the shared browser of the credential renewal fallback
+"""
+
+import importlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.dirname(TESTS))
+
+
+class FakeDriver:
+    current_url = 'about:blank'
+
+    def __init__(self):
+        self.quits = 0
+
+    def quit(self):
+        self.quits += 1
+
+
+@pytest.fixture
+def renew_credentials(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / '.env').write_text('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\n'
+                                   'TELEGRAM_COALESCE_SECONDS=0\nusername=me@example.com\npassword=secret\n')
+    importlib.import_module('config').reload_config()
+    module = importlib.import_module('renew_credentials')
+    monkeypatch.setattr(module, 'send_telegram_message', lambda *a, **k: True)
+    yield module
+    module.FCCCredentialRenewer.close_browser()
+
+
+@pytest.mark.parametrize('shown, typed, ok', [
+    ('me@example.com', 'me@example.com', True),
+    ('(555) 123-4567', '5551234567', True),
+    ('+1 (555) 123-4567', '555-123-4567', True),
+    ('555 123 4567', '+15551234567', True),
+    ('(555) 123-____', '5551234567', False),
+    ('', '5551234567', False),
+])
+def test_input_matches_masked_values(renew_credentials, shown, typed, ok):
+    assert renew_credentials._input_matches(shown, typed) is ok
+
+
+def test_browser_closed_after_last_queued_renewal(renew_credentials, monkeypatch):
+    Renewer = renew_credentials.FCCCredentialRenewer
+    drivers = []
+    monkeypatch.setattr(Renewer, '_create_driver', classmethod(lambda cls: drivers.append(FakeDriver()) or drivers[-1]))
+    monkeypatch.setattr(Renewer, 'request_new_credentials_http', lambda self: False)
+    first_in_browser = threading.Event()
+
+    def browser(self):
+        self.get_driver()
+        first_in_browser.set()
+        time.sleep(0.3)
+        return True
+    monkeypatch.setattr(Renewer, 'request_new_credentials_browser', browser)
+
+    first = threading.Thread(target=Renewer().request_new_credentials)
+    first.start()
+    first_in_browser.wait(5)
+    # A second account queues for the browser while the first uses it
+    assert Renewer().request_new_credentials() is True
+    first.join(5)
+    # Both renewals shared one Chrome, shut down once nobody needed it any more
+    assert len(drivers) == 1 and drivers[0].quits == 1
+    assert Renewer._driver is None and Renewer._browser_users == 0
@@ -0,0 +1,55 @@
+"""
+Tests for the HTTP fast path of the credential request form
+"""
+
+import importlib
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.dirname(TESTS))
+from fake_servers import DEVELOPER_PAGE, DeveloperPageHandler, start_server
+
+
+@pytest.fixture
+def renewer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, base_url = start_server(DeveloperPageHandler)
+    with open(tmp_path / '.env', 'w') as f:
+        f.write('TELEGRAM_BOT_TOKEN=test\nTELEGRAM_CHAT_ID=1\n'
+                'TELEGRAM_COALESCE_SECONDS=0\nusername=me@example.com\npassword=secret\n')
+    importlib.import_module('config').reload_config()
+    renew_credentials = importlib.import_module('renew_credentials')
+    # The progress messages would otherwise go to the real Bot API
+    monkeypatch.setattr(renew_credentials, 'send_telegram_message', lambda *a, **k: True)
+    renewer = renew_credentials.FCCCredentialRenewer()
+    renewer.fcc_url = f'{base_url}/for-developers/free-api'
+    renewer.server = server
+    yield renewer
+    server.shutdown()
+
+
+@pytest.mark.parametrize('reply', [
+    None,
+    ('text/html', '<html><body><h1>Thank you!</h1><p>Your request has been received.</p></body></html>'),
+    ('text/html', '<html><body><p>Done.</p></body></html>'),
+])
+def test_confirmed_submission(renewer, reply):
+    renewer.server.reply = reply
+    assert renewer.request_new_credentials_http() is True
+    assert renewer.server.submissions[0]['developer[email]'] == 'me@example.com'
+
+
+@pytest.mark.parametrize('reply', [
+    ('application/json', '{"ok": false, "errors": ["phone is invalid"]}'),
+    ('text/html', DEVELOPER_PAGE.format(token='csrf-7f3a9c')),
+    ('text/html', ''),
+])
+def test_unconfirmed_submission_falls_back(renewer, reply):
+    # A 200 that shows the form again (or nothing) is not proof the request went through
+    renewer.server.reply = reply
+    assert renewer.request_new_credentials_http() is False
+    assert len(renewer.server.submissions) == 1
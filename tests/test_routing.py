@@ -0,0 +1,41 @@
+"""
+Tests for choosing which chats receive a recording
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routing import Router
+
+
+def conference(id, day):
+    return {'id': id, 'start_time': datetime.strptime(day, '%Y-%m-%d').timestamp() + 3600}
+
+
+def test_default_chat_without_routes():
+    router = Router.load(None, '42')
+    assert router.destinations(conference(1, '2024-03-04')) == ['42']
+
+
+def test_rules(tmp_path):
+    path = tmp_path / 'routes.json'
+    path.write_text(json.dumps([
+        {'chat_id': -1001},
+        {'chat_id': '-1002', 'conferences': [7, '8']},
+        {'chat_id': '-1003', 'since': '2024-03-01', 'until': '2024-03-31', 'weekdays': ['Mon', 'tue']},
+        {'chat_id': '-1001', 'conferences': [7]},
+    ]))
+    router = Router.load(str(path), '42')
+    # 2024-03-04 is a Monday
+    assert router.destinations(conference(7, '2024-03-04')) == ['-1001', '-1002', '-1003']
+    assert router.destinations(conference(8, '2024-03-06')) == ['-1001', '-1002']
+    assert router.destinations(conference(9, '2024-04-01')) == ['-1001']
+
+
+def test_unmatched_falls_back_to_default(tmp_path):
+    path = tmp_path / 'routes.json'
+    path.write_text(json.dumps([{'chat_id': '-1002', 'conferences': [7]}]))
+    assert Router.load(str(path), '42').destinations(conference(9, '2024-03-04')) == ['42']
@@ -0,0 +1,50 @@
+"""
+Tests for the fair multi-account scheduler
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scheduler import FairScheduler
+
+
+def test_takes_turns():
+    scheduler = FairScheduler([('a', range(4), None), ('b', range(2), None), ('c', [], None)])
+    order = []
+    for name, item in scheduler:
+        order.append(name)
+        scheduler.release(name)
+    assert order == ['a', 'b', 'a', 'b', 'a', 'a']
+
+
+def test_capped_source_does_not_block_others():
+    scheduler = FairScheduler([('a', range(3), 1), ('b', range(3), None)])
+    order = []
+    for name, item in scheduler:
+        order.append(name)
+        if name == 'b' and item == 2:
+            # The first 'a' is still in flight; 'a' only moves again once it is done
+            threading.Timer(0.1, scheduler.release, args=('a',)).start()
+        elif (name, item) != ('a', 0):
+            scheduler.release(name)
+    assert order == ['a', 'b', 'b', 'b', 'a', 'a']
+
+
+def test_failing_source_is_isolated():
+    def broken():
+        yield 1
+        raise RuntimeError('listing failed')
+
+    scheduler = FairScheduler([('a', broken(), None), ('b', range(3), None)])
+    items = [(name, item) for name, item in scheduler]
+    assert items == [('a', 1), ('b', 0), ('b', 1), ('b', 2)]
+    assert isinstance(scheduler.errors['a'], RuntimeError)
+
+
+def test_stops_while_waiting_for_capacity():
+    stop = threading.Event()
+    scheduler = FairScheduler([('a', range(3), 1)], stopped=stop.is_set)
+    threading.Timer(0.2, stop.set).start()
+    assert [item for _, item in scheduler] == [0]
@@ -0,0 +1,58 @@
+"""
+Tests for the local recording state index
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from state import StateIndex
+
+
+def test_progress_survives_reopen(tmp_path):
+    path = str(tmp_path / 'state.db')
+    index = StateIndex(path)
+    assert index.get(42, 'https://rec/42') is None
+    index.mark_downloaded(42, 'https://rec/42', 1000)
+    index.mark_uploaded(42, 'https://rec/42', 'AgADfileid')
+    index.close()
+
+    index = StateIndex(path)
+    row = index.get('42', 'https://rec/42')
+    assert row['bytes'] == 1000
+    assert row['file_id'] == 'AgADfileid'
+    assert row['uploaded_at'] and row['deleted_at'] is None
+    index.mark_deleted(42, 'https://rec/42')
+    assert index.get(42, 'https://rec/42')['deleted_at']
+    # A new recording for the same conference is tracked separately
+    assert index.get(42, 'https://rec/42-b') is None
+
+
+def test_wal_mode(tmp_path):
+    index = StateIndex(str(tmp_path / 'state.db'))
+    assert index._db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_cursors(tmp_path):
+    path = str(tmp_path / 'state.db')
+    index = StateIndex(path)
+    assert index.get_cursor('conferences') is None
+    index.set_cursor('conferences', 1700000000)
+    index.set_cursor('conferences', 1700003600)
+    index.close()
+
+    index = StateIndex(path)
+    assert index.get_cursor('conferences') == 1700003600
+    assert index.get_cursor('full_scan') is None
+
+
+def test_deliveries(tmp_path):
+    index = StateIndex(str(tmp_path / 'state.db'))
+    assert index.deliveries(42, 'https://rec/42') == {}
+    index.mark_delivery_failed(42, 'https://rec/42', '-1002', 'timeout')
+    index.mark_delivered(42, 'https://rec/42', '1', 'AgADa,AgADb')
+    index.mark_delivered(42, 'https://rec/42', '-1002', 'AgADc,AgADd')
+    done = index.deliveries('42', 'https://rec/42')
+    assert done['1']['file_ids'] == 'AgADa,AgADb' and done['1']['attempts'] == 1
+    assert done['-1002']['delivered_at'] and done['-1002']['attempts'] == 2
+    assert done['-1002']['last_error'] is None
@@ -0,0 +1,79 @@
+"""
+Tests for the Telegram rate limiting and message digests
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telegram_queue import TokenBucket, MessageQueue
+
+
+def test_bucket_rate_and_pause():
+    bucket = TokenBucket(20, capacity=2)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    # Two from the burst, then one every 50 ms
+    assert 0.08 < time.monotonic() - start < 0.5
+
+    bucket.pause(0.3)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.28
+
+
+def test_digests_split_at_max_length():
+    queue = MessageQueue(lambda chat, text: (True, None), TokenBucket(100, 100), max_length=25)
+    digests = queue._digests([('a', 'one'), ('b', 'two'), ('a', 'three'), ('a', 'x' * 20), ('b', 'four')])
+    assert digests == [('a', 'one\n\nthree'), ('a', 'x' * 20), ('b', 'two\n\nfour')]
+
+
+def test_flush_sends_one_digest_per_chat():
+    sent = []
+    queue = MessageQueue(lambda chat, text: (sent.append((chat, text)) or True, None),
+                         TokenBucket(100, 100), chat_rate=100, coalesce=0.05)
+    for n in range(5):
+        queue.put('a', f'm{n}')
+    queue.put('b', 'other')
+    assert queue.flush(timeout=5)
+    assert sorted(sent) == [('a', 'm0\n\nm1\n\nm2\n\nm3\n\nm4'), ('b', 'other')]
+
+
+def test_flush_retries_after_429():
+    replies = [(False, 0.2), (True, None)]
+    calls = []
+
+    def send(chat, text):
+        calls.append(time.monotonic())
+        return replies.pop(0)
+
+    queue = MessageQueue(send, TokenBucket(100, 100), chat_rate=100, coalesce=0)
+    queue.put('a', 'hello')
+    assert queue.flush(timeout=5)
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.18
+
+
+def test_chat_429_does_not_pause_other_chats():
+    global_bucket = TokenBucket(100, 100)
+    queue = MessageQueue(lambda chat, text: (True, None), global_bucket, chat_rate=100)
+    queue.retry_after('a', 5)
+    start = time.monotonic()
+    queue.acquire('b')
+    assert time.monotonic() - start < 0.1
+    assert queue.bucket_for('a').paused_until > time.monotonic() + 4
+
+    # A second chat throttled while the first is paused means the bot-wide limit
+    queue.retry_after('b', 0.3)
+    start = time.monotonic()
+    queue.acquire('c')
+    assert time.monotonic() - start >= 0.28
+
+
+def test_bot_wide_429_pauses_everyone():
+    queue = MessageQueue(lambda chat, text: (True, None), TokenBucket(100, 100), chat_rate=100)
+    queue.retry_after(None, 0.3)
+    start = time.monotonic()
+    queue.acquire('a')
+    assert time.monotonic() - start >= 0.28
@@ -0,0 +1,61 @@
+"""
+Tests for the optional Opus transcoding stage
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_cache import file_digest
+from transcode import Transcoder, TranscodeError
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+
+
+def test_segments_fit_upload_limit():
+    transcoder = Transcoder(24000, max_bytes=49 * 1024 * 1024, ffmpeg='ffmpeg')
+    seconds = transcoder.segment_seconds()
+    assert seconds * 24000 / 8 < 49 * 1024 * 1024
+    # About 4.5 hours of speech per 49 MiB part at 24 kbit/s
+    assert 4 * 3600 < seconds < 5 * 3600
+    cmd = transcoder.command('in.mp3', 'spool/42')
+    assert cmd[-1] == 'spool/42.%03d.ogg' and str(seconds) in cmd
+    assert Transcoder(24000, ffmpeg='ffmpeg').command('in.mp3', 'spool/42')[-1] == 'spool/42.000.ogg'
+
+
+def test_missing_ffmpeg(tmp_path):
+    transcoder = Transcoder()
+    transcoder.ffmpeg = None
+    with pytest.raises(TranscodeError):
+        transcoder.transcode(str(tmp_path / 'in.mp3'), str(tmp_path / 'out'))
+
+
+@needs_ffmpeg
+def test_encodes_smaller_parts(tmp_path):
+    src = str(tmp_path / 'call.mp3')
+    subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-f', 'lavfi', '-i', 'anoisesrc=color=pink:duration=120',
+                    '-ac', '1', '-b:a', '128k', src], check=True)
+    # Tiny limit so the 2 minutes are cut into several parts
+    transcoder = Transcoder(16000, workers=2, max_bytes=100_000)
+    transcoder.segment_seconds = lambda: 30
+    parts = transcoder.transcode(src, str(tmp_path / 'call'))
+    assert len(parts) >= 4
+    assert all(p.endswith('.ogg') for p in parts)
+    assert sum(os.path.getsize(p) for p in parts) < os.path.getsize(src) / 4
+
+
+@needs_ffmpeg
+def test_output_is_deterministic(tmp_path):
+    src = str(tmp_path / 'call.mp3')
+    subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-f', 'lavfi', '-i', 'anoisesrc=color=pink:duration=60',
+                    '-ac', '1', '-b:a', '64k', src], check=True)
+    transcoder = Transcoder(16000, max_bytes=100_000)
+    transcoder.segment_seconds = lambda: 20
+    # Re-encoding a recording must give the same bytes, or its cached file_id never matches
+    first = [file_digest(p) for p in transcoder.transcode(src, str(tmp_path / 'a'))]
+    second = [file_digest(p) for p in transcoder.transcode(src, str(tmp_path / 'b'))]
+    assert len(first) >= 3 and first == second
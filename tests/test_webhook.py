@@ -0,0 +1,34 @@
+"""
+Tests for the recording-ready notification receiver
+"""
+
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from webhook import RecordingWebhook
+
+
+def test_notification_wakes_daemon():
+    receiver = RecordingWebhook(0).start()
+    try:
+        r = requests.post(f'http://127.0.0.1:{receiver.port}/recording-ready', json={'conference_id': 1})
+        assert r.status_code == 204
+        assert receiver.wake.wait(1)
+    finally:
+        receiver.close()
+
+
+def test_token_required():
+    receiver = RecordingWebhook(0, token='s3cret').start()
+    try:
+        url = f'http://127.0.0.1:{receiver.port}/recording-ready'
+        assert requests.post(url).status_code == 403
+        assert not receiver.wake.is_set()
+        assert requests.post(url, headers={'X-Webhook-Token': 's3cret'}).status_code == 204
+        assert requests.post(url + '?token=s3cret').status_code == 204
+        assert receiver.wake.is_set()
+    finally:
+        receiver.close()
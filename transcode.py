@@ -0,0 +1,73 @@
+"""
+Optional Opus re-encoding of recordings before upload
+Conference audio is speech, which Opus at 16-32 kbit/s carries about as well as
+the MP3 FCC serves at several times the size. Encoding is done by ffmpeg, which
+must be installed (with libopus) for TRANSCODE=opus to work.
+"""
+
+import glob
+import os
+import shutil
+import subprocess
+import threading
+from metrics import metrics
+
+class TranscodeError(Exception):
+    pass
+
+
+class Transcoder:
+    """Re-encode recordings to mono Opus in Ogg files.
+
+    Every encode runs in its own ffmpeg process, so up to `workers` recordings
+    encode in parallel on separate cores; further callers wait for a free slot.
+    With max_bytes set the output is cut by duration into files that each fit
+    the upload limit at the target bitrate, so no splitting is needed later.
+    """
+
+    def __init__(self, bitrate=24000, workers=None, max_bytes=None, ffmpeg=None):
+        self.bitrate = int(bitrate)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_bytes = max_bytes
+        self.ffmpeg = ffmpeg or shutil.which('ffmpeg')
+        self._slots = threading.BoundedSemaphore(self.workers)
+
+    def segment_seconds(self):
+        """Longest part in seconds that stays under max_bytes, None for one file"""
+        if not self.max_bytes:
+            return None
+        # Opus VBR and the Ogg pages can overshoot the nominal bitrate a little
+        return max(60, int(self.max_bytes * 8 * 0.9 / self.bitrate))
+
+    def command(self, src, dest_prefix):
+        # bitexact drops the random Ogg stream serials and the encoder version tag, so
+        # the same recording always encodes to the same bytes and its file_id is reused
+        cmd = [self.ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+               '-i', src, '-vn', '-map_metadata', '-1', '-ac', '1',
+               '-c:a', 'libopus', '-b:a', str(self.bitrate), '-application', 'voip',
+               '-fflags', '+bitexact', '-flags:a', '+bitexact']
+        seconds = self.segment_seconds()
+        if seconds:
+            cmd += ['-f', 'segment', '-segment_time', str(seconds), '-segment_format', 'ogg',
+                    '-reset_timestamps', '1', dest_prefix + '.%03d.ogg']
+        else:
+            cmd += ['-f', 'ogg', dest_prefix + '.000.ogg']
+        return cmd
+
+    def transcode(self, src, dest_prefix):
+        """Encode src into dest_prefix.NNN.ogg files, returns their paths in order"""
+        if not self.ffmpeg:
+            raise TranscodeError('ffmpeg not found; install it or unset TRANSCODE')
+        # Leftovers of an interrupted encode would be taken for parts
+        for old in glob.glob(glob.escape(dest_prefix) + '.*.ogg'):
+            os.remove(old)
+        with self._slots, metrics.span('transcode'):
+            result = subprocess.run(self.command(src, dest_prefix), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise TranscodeError(f'ffmpeg failed ({result.returncode}): {result.stderr.strip()[-500:]}')
+        outputs = sorted(glob.glob(glob.escape(dest_prefix) + '.*.ogg'))
+        if not outputs:
+            raise TranscodeError(f'ffmpeg wrote no output for {src}')
+        metrics.count('bytes_total', os.path.getsize(src), direction='transcode_in')
+        metrics.count('bytes_total', sum(os.path.getsize(p) for p in outputs), direction='transcode_out')
+        return outputs
@@ -0,0 +1,65 @@
+import hmac
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from metrics import metrics
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _authorized(self):
+        token = self.server.receiver.token
+        if not token:
+            return True
+        given = self.headers.get('X-Webhook-Token') or parse_qs(urlsplit(self.path).query).get('token', [''])[0]
+        return hmac.compare_digest(given.encode(), token.encode())
+
+    def do_POST(self):
+        # The payload is not trusted or parsed; a notification only triggers a listing
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(min(length, 65536))
+        if not self._authorized():
+            metrics.count('webhook_events_total', result='rejected')
+            self.send_response(403)
+            self.end_headers()
+            return
+        metrics.count('webhook_events_total', result='accepted')
+        self.server.receiver.wake.set()
+        self.send_response(204)
+        self.end_headers()
+
+    do_PUT = do_POST
+
+
+class RecordingWebhook:
+    """Local HTTP receiver for "recording ready" notifications.
+
+    Any authorised POST sets `wake`, which the daemon waits on between polls,
+    so a new recording is picked up right away instead of at the next poll.
+    The request body is ignored: the daemon then runs an incremental listing,
+    which is what actually finds the new conference. When token is set, the
+    sender must pass it in an X-Webhook-Token header or a ?token= parameter.
+    """
+
+    def __init__(self, port, host='127.0.0.1', token=None, wake=None):
+        self.token = token
+        self.wake = wake or threading.Event()
+        self._server = ThreadingHTTPServer((host, int(port)), _NotificationHandler)
+        self._server.daemon_threads = True
+        self._server.receiver = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='recording-webhook', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()